@@ -1,10 +1,16 @@
 import os
 import json
 import datetime
-from pya3 import Aliceblue
 
 API_FILE = "api_credentials.json"
 
+# Lower-cased fragments of the broker's replies to an expired or logged-out session
+SESSION_MESSAGES = ("session", "unauthori", "not logged", "invalid token")
+
+
+class SessionError(Exception):
+    """The broker rejected the session: it expired or was logged out."""
+
 def save_credentials(user_id, api_key):
     """ Save AliceBlue credentials in a file for the day. """
     credentials = {
@@ -36,6 +42,25 @@ def initialize_alice():
     if not user_id or not api_key:
         raise Exception("AliceBlue credentials not found. Please log in.")
 
+    return create_session(user_id, api_key)
+
+def create_session(user_id, api_key):
+    """ Log in to AliceBlue and return the session; raises if the login is refused. """
+    from pya3 import Aliceblue  # slow to import, only needed once a session is made
+
     alice = Aliceblue(user_id=user_id, api_key=api_key)
-    alice.get_session_id()
+    response = alice.get_session_id()
+    if not alice.session_id:
+        message = response.get("emsg") if isinstance(response, dict) else response
+        raise Exception(f"AliceBlue login failed: {message}")
     return alice
+
+def is_session_message(message):
+    """ True if a broker error message means the session is no longer valid. """
+    message = str(message or "").lower()
+    return any(m in message for m in SESSION_MESSAGES)
+
+def session_rejected(alice, message):
+    """ Mark a session the broker rejected, so the app logs in again, and return the error to raise. """
+    alice.session_expired = True
+    return SessionError(f"AliceBlue session rejected: {message}")
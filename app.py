@@ -1,12 +1,19 @@
 import streamlit as st
-import pandas as pd
 import datetime
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from alice_client import initialize_alice, save_credentials, load_credentials
-from stock_analysis import analyze_all_tokens, fetch_stock_data_up, fetch_stock_data_down  # Import your analysis functions
+import threading
+import time
+from alice_client import create_session, save_credentials, load_credentials
+from nse_calendar import last_completed_session
+from metrics import BUCKETS, METRICS
 from stock_lists import STOCK_LISTS
 
+# The names of scan_engine.STRATEGIES, so the selectors render without importing it
+STRATEGY_NAMES = ["3-5% Gainers", "3-5% Losers", "EMA, RSI & Support Zone"]
+
+# pandas, NumPy and the scan modules are imported where they are used: a
+# fresh server paints the page before paying for them, and reruns find them
+# already loaded.
+
 st.set_page_config(page_title="Stock Screener", layout="wide")
 st.warning("This screener is based on statistical analysis. Please conduct your own due diligence before making any trading decisions. This application is best compatible with **Google Chrome**.")
 
@@ -23,102 +30,303 @@ if not user_id or not api_key:
         st.success("API credentials saved! Refreshing...")
         st.rerun()
 
-try:
-    alice = initialize_alice()
-except Exception as e:
-    st.error(f"Failed to initialize AliceBlue API: {e}")
-    alice = None
 
+@st.cache_resource(max_entries=4)
+def get_broker_session(user_id, api_key, day):
+    """One AliceBlue login per day and credentials, shared by every session and rerun.
 
-@st.cache_data(ttl=300)
-def fetch_screened_stocks(tokens, strategy):
-    """Fetch and analyze stocks based on selected strategy concurrently."""
+    AliceBlue sessions end with the trading day, so `day` expires the cached
+    one; a failed login raises and is not cached, so the next rerun retries.
+    """
+    return create_session(user_id, api_key)
+
+
+def get_alice():
+    """The broker session, logging in when a scan or the live view first needs it; None if that fails."""
     try:
-        if not alice:
-            raise Exception("AliceBlue API is not initialized.")
-        
-        if strategy == "3-5% Gainers":
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                futures = {executor.submit(fetch_stock_data_up, alice, token): token for token in tokens}
-                results = [future.result() for future in as_completed(futures)]
-            return [res for res in results if res is not None]
+        if not user_id or not api_key:
+            raise Exception("AliceBlue credentials not found. Please log in.")
+        alice = get_broker_session(user_id, api_key, datetime.date.today())
+        if getattr(alice, 'session_expired', False):
+            # Rejected by the broker since it was cached, e.g. logged out elsewhere
+            get_broker_session.clear()
+            alice = get_broker_session(user_id, api_key, datetime.date.today())
+        return alice
+    except Exception as e:
+        st.error(f"Failed to initialize AliceBlue API: {e}")
+        return None
 
-        elif strategy == "3-5% Losers":
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                futures = {executor.submit(fetch_stock_data_down, alice, token): token for token in tokens}
-                results = [future.result() for future in as_completed(futures)]
-            return [res for res in results if res is not None]
 
-        elif strategy == "EMA, RSI & Support Zone":
-            return analyze_all_tokens(alice, tokens)
+def check_session(alice):
+    """Drop a session the broker rejected during a scan, so the next one logs in again."""
+    if getattr(alice, 'session_expired', False):
+        get_broker_session.clear()
+        st.error("The AliceBlue session has expired; results may be incomplete. Scan again to log in anew.")
+
+
+def fetch_screened_stocks(instruments, strategy):
+    """Fetch and analyze stocks based on selected strategy concurrently."""
+    from result_cache import cached_scan
+    from scan_engine import scan_rows
+
+    alice = get_alice()
+    if not alice:
+        return []
+    try:
+        # Results are shared with every other session until the next NSE close
+        return cached_scan(instruments, strategy, lambda batch: scan_rows(alice, batch, strategy))
     except Exception as e:
         st.error(f"Error fetching stock data: {e}")
         return []
+    finally:
+        check_session(alice)
 
 
-def clean_and_display_data(data, strategy):
-    """Clean and convert the data into a DataFrame based on the strategy."""
-    if not data or not isinstance(data, list):
-        return pd.DataFrame()
+def stream_screened_stocks(instruments, strategy):
+    """Scan stocks, showing hits and progress while tokens complete."""
+    from result_cache import ResultCache
+    from results import ResultTable
+    from scan_engine import STRATEGIES, has_session_frame, iter_scan
+
+    alice = get_alice()
+    if not alice:
+        return []
+
+    cache = ResultCache(strategy)
+    cached, missing = cache.lookup(instrument.token for instrument in instruments)
+    results = [row for row in cached.values() if row is not None]
+    if not missing:
+        return results
+
+    # Stream only the tokens this session claimed; the rest are either being
+    # scanned by another session or get picked up by cached_scan at the end
+    claimed = cache.claim(missing)
+    mine = set(claimed)
+    progress_bar = st.progress(0.0)
+    status = st.empty()
+    table = st.empty()
+    last_refresh = 0.0
+
+    # A rerun or stop raises out of the loop; the leases are released either way
+    with cache.leasing(claimed):
+        for progress, rows in iter_scan(alice, [i for i in instruments if i.token in mine], [strategy]):
+            if rows is not None and has_session_frame(progress.token, STRATEGIES[strategy].lookback_days):
+                cache.store({progress.token: rows[strategy]})
+            row = rows[strategy] if rows else None
+            if row is not None:
+                results.append(row)
+
+            progress_bar.progress(progress.done / progress.total)
+            status.caption(f"{progress.done}/{progress.total} scanned · {len(results)} found · "
+                           f"{progress.errors} errors · {progress.throughput:.1f} stocks/s")
+
+            # Redrawing the table is the slow part, so cap it at a few times a second
+            if row is not None and time.monotonic() - last_refresh > 0.5:
+                show_results(ResultTable.from_rows(results, STRATEGIES[strategy].columns), strategy, table)
+                last_refresh = time.monotonic()
+
+    table.empty()
+    check_session(alice)
+    if len(claimed) < len(missing):
+        with st.spinner("Waiting for another session scanning the same stocks..."):
+            return fetch_screened_stocks(instruments, strategy)
+    return results
+
+
+def forget_results(instruments, strategy):
+    """Make the next scan of instruments fetch fresh bars and recompute every row."""
+    from bar_store import expire_topups
+    from result_cache import ResultCache
+    from scan_engine import clear_session_frames
+
+    tokens = [instrument.token for instrument in instruments]
+    ResultCache(strategy).evict(tokens)
+    clear_session_frames(tokens)
+    expire_topups(tokens)
+
+
+# Strongest support first, then the closest to it
+TOP_CANDIDATE_ORDER = [('Strength', True), ('Distance%', False)]
+
+
+@st.cache_resource
+def live_feed_slot():
+    """Holds the server's live feed and the broker session it runs on."""
+    return {'lock': threading.Lock(), 'session_id': None, 'feed': None}
 
-    if strategy in ["3-5% Gainers", "3-5% Losers"]:
-        df = pd.DataFrame(data)
-        df["Close"] = df["Close"].astype(float).round(2)
-        df["Change (%)"] = df["Change (%)"].astype(float).round(2)
-    else:
-        df = pd.DataFrame(data)
-        df["Price"] = df["Price"].astype(float).round(2)
-        df["Support"] = df["Support"].astype(float).round(2)
-        df["Distance%"] = df["Distance%"].astype(float).round(2)
-        df["RSI"] = df["RSI"].astype(float).round(2)
-    
-    search = st.text_input("Search Stocks:", "").upper()
-    if search and "Name" in df.columns:
-        df = df[df["Name"].str.contains(search, na=False, regex=False)]
-    
-    return df
-
-
-def safe_display(df, title):
-    """Displays the stock data with clickable TradingView links."""
-    if df.empty:
-        st.warning(f"No stocks found for {title}")
-    else:
-        st.markdown(f"## {title}")
-        
-        # Convert 'Name' column into clickable TradingView links
-        if "Name" in df.columns:
-            df["Name"] = df["Name"].apply(lambda x: f'<a href="https://in.tradingview.com/chart?symbol=NSE%3A{x}" target="_blank">{x}</a>')
-        
-        # Render the DataFrame with clickable links
-        st.markdown(df.to_html(escape=False), unsafe_allow_html=True)
+
+def get_live_feed(alice):
+    """One websocket feed per server; every session watches its lists through it.
+
+    The feed is tied to the broker session, so a new login replaces it and
+    the old one is stopped.
+    """
+    from live_feed import LiveFeed
+
+    slot = live_feed_slot()
+    with slot['lock']:
+        if slot['feed'] is None or slot['session_id'] != alice.session_id:
+            if slot['feed'] is not None:
+                slot['feed'].stop()
+            slot['feed'], slot['session_id'] = LiveFeed(alice).start(), alice.session_id
+        return slot['feed']
+
+
+def show_live(alice, instruments, strategy):
+    """Redraw the live results of a stock list every second until the page reruns."""
+    from results import ResultTable
+    from scan_engine import STRATEGIES
+
+    feed = get_live_feed(alice)
+    with st.spinner("Loading history for live mode..."):
+        feed.watch(instruments)
+
+    tokens = {instrument.token for instrument in instruments}
+    status = st.empty()
+    placeholder = st.empty()
+    while True:
+        if strategy == "3-5% Gainers":
+            rows = feed.screener.gainers(tokens)
+        elif strategy == "3-5% Losers":
+            rows = feed.screener.losers(tokens)
+        else:
+            rows = feed.screener.buy_signals(tokens)
+        table = ResultTable.from_rows(rows, STRATEGIES[strategy].columns)
+        if strategy == "EMA, RSI & Support Zone":
+            table = table.top(10, TOP_CANDIDATE_ORDER)
+
+        state = "connected" if feed.connected.is_set() else "connecting..."
+        status.caption(f"Live · {state} · {len(table)} found · updated {datetime.datetime.now():%H:%M:%S}")
+        show_results(table, strategy, placeholder)
+        time.sleep(1)
+
+
+def show_results(table, title, container=st):
+    """Render a ResultTable with clickable TradingView names."""
+    import numpy as np
+
+    if not len(table):
+        container.warning(f"No stocks found for {title}")
+        return
+
+    column_config = {'Name': st.column_config.LinkColumn("Name", display_text=r"NSE%3A(.*)$")}
+    for name, dtype in table.schema:
+        if dtype is np.float64:
+            column_config[name] = st.column_config.NumberColumn(name, format="%.2f")
+    container.dataframe(table.to_frame(), hide_index=True, column_config=column_config)
+
+
+def show_diagnostics():
+    """Stage latencies and error counters of every scan run by this server."""
+    import pandas as pd
+
+    snapshot = METRICS.snapshot()
+    with st.expander("Diagnostics", expanded=True):
+        if not snapshot['stages']:
+            st.info("No scans measured yet.")
+            return
+
+        st.dataframe(pd.DataFrame([{
+            'Stage': stage,
+            'Count': h['count'],
+            'Mean (ms)': round(h['mean'] * 1000, 1),
+            'p50 (ms)': round(h['p50'] * 1000, 1),
+            'p95 (ms)': round(h['p95'] * 1000, 1),
+            'Max (ms)': round(h['max'] * 1000, 1),
+            'Total (s)': round(h['total'], 2),
+        } for stage, h in snapshot['stages'].items()]), hide_index=True)
+
+        if snapshot['counters']:
+            st.dataframe(pd.DataFrame(sorted(snapshot['counters'].items()), columns=['Counter', 'Value']),
+                         hide_index=True)
+
+        stage = st.selectbox("Latency histogram:", list(snapshot['stages']))
+        # Fixed-width labels keep the buckets in order on the chart
+        labels = [f"{b * 1000:>9.1f} ms" for b in BUCKETS] + ["   longer"]
+        st.bar_chart(pd.Series(list(snapshot['stages'][stage]['buckets'].values()), index=labels))
+
+        slowest = METRICS.slowest(stage)
+        if slowest:
+            st.caption(f"Slowest tokens in {stage}")
+            st.dataframe(pd.DataFrame(slowest, columns=['Token', 'Seconds']), hide_index=True)
+
+        st.download_button("Download JSON", METRICS.to_json(), file_name="scan_metrics.json",
+                           mime="application/json")
+        if st.button("Reset diagnostics"):
+            METRICS.reset()
+            st.rerun()
 
 
 st.title("Stock Screener")
 
 selected_list = st.selectbox("Select Stock List:", list(STOCK_LISTS.keys()))
-strategy = st.selectbox("Select Strategy:", ["3-5% Gainers", "3-5% Losers", "EMA, RSI & Support Zone"])
+strategy = st.selectbox("Select Strategy:", STRATEGY_NAMES)
+stream = st.checkbox("Show results as they arrive", value=True)
+live = st.checkbox("Live prices", help="Follow today's ticks instead of the previous session's close")
+diagnostics = st.sidebar.checkbox("Show diagnostics")
+
+start_col, rescan_col = st.columns([1, 6])
+start = start_col.button("Start Screening")
+rescan = rescan_col.button("Rescan now", help="Ignore the nightly snapshot and scan the stock list again")
+
+if live:
+    from instruments import resolve_stock_list
 
-if st.button("Start Screening"):
-    tokens = STOCK_LISTS.get(selected_list, [])
-    if not tokens:
-        st.warning(f"No stocks found for {selected_list}.")
+    alice = get_alice()
+    if not alice:
+        st.error("Live mode needs the AliceBlue API to be initialized.")
     else:
-        with st.spinner("Fetching and analyzing stocks..."):
-            screened_stocks = fetch_screened_stocks(tokens, strategy)
-        
-        if strategy in ["3-5% Gainers", "3-5% Losers"]:
-            df = clean_and_display_data(screened_stocks, strategy)
-            safe_display(df, strategy)
-        elif strategy == "EMA, RSI & Support Zone":
-            sorted_signals = sorted(screened_stocks, key=lambda x: (-x.get('Strength', 0), x.get('Distance%', 0)))
-            top_candidates = sorted_signals[:10]
-            if top_candidates:
-                df = pd.DataFrame(top_candidates)
-                df["Price"] = df["Price"].astype(float).round(2)
-                df["Support"] = df["Support"].astype(float).round(2)
-                df["Distance%"] = df["Distance%"].astype(float).round(2)
-                df["RSI"] = df["RSI"].astype(float).round(2)
-                safe_display(df, "Top Buy Candidates")
-            else:
-                st.warning("No stocks found for EMA, RSI & Support Zone strategy.")
+        # Diagnostics first, the live view keeps redrawing until the next rerun
+        if diagnostics:
+            show_diagnostics()
+        show_live(alice, resolve_stock_list(selected_list), strategy)
+
+if start or rescan:
+    # The scan modules are loaded once a scan is asked for
+    from instruments import resolve_stock_list
+    from results import ResultTable
+    from scan_engine import STRATEGIES
+    from snapshots import load_results
+
+    # The nightly batch screener usually has the answer already
+    snapshot, manifest = (None, None) if rescan else load_results(selected_list, strategy, last_completed_session())
+    table, caption = None, None
+    if snapshot is not None:
+        table = ResultTable.from_frame(snapshot, STRATEGIES[strategy].columns)
+        caption = (f"From the snapshot of {manifest['created']} (session {manifest['session']}). "
+                   "Press Rescan now to scan again.")
+    else:
+        instruments = resolve_stock_list(selected_list)
+        screened_stocks = None
+        if rescan:
+            # The result cache holds what the batch screener scanned too
+            forget_results(instruments, strategy)
+        if not instruments:
+            st.warning(f"No stocks found for {selected_list}.")
+        elif stream:
+            screened_stocks = stream_screened_stocks(instruments, strategy)
+        else:
+            with st.spinner("Fetching and analyzing stocks..."):
+                screened_stocks = fetch_screened_stocks(instruments, strategy)
+        if screened_stocks is not None:
+            table = ResultTable.from_rows(screened_stocks, STRATEGIES[strategy].columns)
+
+    # Kept across reruns, so searching filters these results instead of scanning again
+    st.session_state['results'] = None if table is None else {
+        'list': selected_list, 'strategy': strategy, 'table': table, 'caption': caption,
+    }
+
+results = st.session_state.get('results')
+if not live and results and (results['list'], results['strategy']) == (selected_list, strategy):
+    table, title = results['table'], strategy
+    if strategy == "EMA, RSI & Support Zone":
+        table, title = table.top(10, TOP_CANDIDATE_ORDER), "Top Buy Candidates"
+    if results['caption']:
+        st.caption(results['caption'])
+
+    search = st.text_input("Search Stocks:", "")
+    st.markdown(f"## {title}")
+    show_results(table.search(search), title)
+
+if diagnostics:
+    show_diagnostics()
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from alice_client import is_session_message, session_rejected
+from bar_store import load_bars, missing_ranges, store_fetched
+from metrics import METRICS
+
+# Sustained requests per second and burst size allowed towards the broker.
+DEFAULT_RATE = 10
+DEFAULT_BURST = 10
+DEFAULT_CONCURRENCY = 10
+
+THROTTLE_MESSAGES = ("too many", "rate limit", "throttl")
+
+
+class ThrottledError(Exception):
+    """The broker rejected a request for exceeding its rate limit."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every scan in the process.
+
+    Callers reserve a token and sleep until it becomes available, so the bucket
+    works across event loops and threads alike.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token and return how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def drain(self):
+        """Empty the bucket after the broker throttled us."""
+        with self._lock:
+            self.tokens = min(self.tokens, 0)
+            self.updated = time.monotonic()
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+# Processes logged in to the same account share its rate limit: BROKER_RATE is
+# this process's part of it (sharded_scan splits it between its workers)
+_rate = float(os.environ.get("BROKER_RATE", DEFAULT_RATE))
+SHARED_BUCKET = TokenBucket(_rate, max(1, round(DEFAULT_BURST * _rate / DEFAULT_RATE)))
+
+
+def _is_throttle_message(message):
+    message = str(message or "").lower()
+    return any(m in message for m in THROTTLE_MESSAGES)
+
+
+class HistoryClient:
+    """Blocking chart/history calls on pooled, kept-alive HTTP connections.
+
+    Sends the same request as `Aliceblue.get_historical`, which opens a new
+    connection per call, raises ThrottledError on 429-style responses and
+    SessionError when the session was rejected.
+    """
+
+    def __init__(self, alice, base_url=None, timeout=10, pool_size=DEFAULT_CONCURRENCY):
+        self.alice = alice
+        self.base_url = base_url or alice.base_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_maxsize=self.pool_size))
+            session.mount('http://', HTTPAdapter(pool_maxsize=self.pool_size))
+            self._local.session = session
+        return session
+
+    def get_historical(self, instrument, from_datetime, to_datetime, interval):
+        payload = json.dumps({
+            "token": str(instrument.token),
+            "exchange": instrument.exchange,
+            "from": str(int(from_datetime.timestamp())) + '000',
+            "to": str(int(to_datetime.timestamp())) + '000',
+            "resolution": interval,
+        })
+        headers = {
+            "X-SAS-Version": "2.0",
+            "User-Agent": self.alice._user_agent(),
+            "Authorization": self.alice._user_authorization(),
+            "Content-Type": "application/json",
+        }
+        response = self._session().post(self.base_url + "chart/history", data=payload,
+                                        headers=headers, timeout=self.timeout)
+        if response.status_code == 429:
+            raise ThrottledError(f"HTTP 429 for token {instrument.token}")
+        if response.status_code in (401, 403):
+            raise session_rejected(self.alice, f"HTTP {response.status_code}")
+        response.raise_for_status()
+
+        data = response.json()
+        if data.get('stat') == 'Not_Ok':
+            if _is_throttle_message(data.get('emsg')):
+                raise ThrottledError(data.get('emsg'))
+            if is_session_message(data.get('emsg')):
+                raise session_rejected(self.alice, data.get('emsg'))
+            return data
+
+        df = pd.DataFrame(data['result']).rename(columns={'time': 'datetime'})
+        return df[['datetime', 'open', 'high', 'low', 'close', 'volume']]
+
+
+def make_history_client(alice):
+    """Use pooled HTTP connections for pya3 sessions, anything else as-is."""
+    if hasattr(alice, 'base_url') and hasattr(alice, '_user_authorization'):
+        return HistoryClient(alice)
+    return alice
+
+
+class AsyncBroker:
+    """Async facade over a blocking broker with rate limiting and retries.
+
+    Every historical request waits for a token from the shared bucket, at most
+    `max_concurrency` requests are in flight, and throttled or dropped requests
+    are retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, alice, bucket=SHARED_BUCKET, max_concurrency=DEFAULT_CONCURRENCY,
+                 max_retries=4, backoff=0.5):
+        self.alice = alice
+        self.client = make_history_client(alice)
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._semaphore = None
+        self._max_concurrency = max_concurrency
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _fetch(self, instrument, from_datetime, to_datetime, interval):
+        # Timed on the worker thread, so waiting for the executor is not counted
+        with METRICS.timer('fetch', instrument.token):
+            return self.client.get_historical(instrument, from_datetime, to_datetime, interval)
+
+    async def get_historical(self, instrument, from_datetime, to_datetime, interval):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                async with self._semaphore:
+                    self.stats['requests'] += 1
+                    return await self._run(self._fetch, instrument, from_datetime, to_datetime, interval)
+            except (ThrottledError, requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                if isinstance(e, ThrottledError):
+                    self.stats['throttled'] += 1
+                    METRICS.count('throttled')
+                    self.bucket.drain()
+                self.stats['retries'] += 1
+                METRICS.count('retries')
+                await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+async def get_bars_async(broker, instrument, days):
+    """Async counterpart of `bar_store.get_bars` routed through an AsyncBroker."""
+    token = instrument.token
+    to_datetime = datetime.now()
+    from_datetime = to_datetime - timedelta(days=days)
+
+    stored = await asyncio.to_thread(load_bars, token)
+    fetched = [await broker.get_historical(instrument, start, end, "D")
+               for start, end in missing_ranges(token, stored, from_datetime, to_datetime)]
+    return await asyncio.to_thread(store_fetched, token, stored, fetched, from_datetime)
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from alice_client import is_session_message, session_rejected
+from metrics import METRICS
+
+# One Parquet file per token, e.g. data/bars/token=2885.parquet
+STORE_DIR = os.environ.get("BAR_STORE_DIR", os.path.join("data", "bars"))
+BAR_COLUMNS = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+
+# A token that was topped up this recently is served straight from disk.
+TOPUP_INTERVAL = 15 * 60
+
+# Lower-cased fragments of the broker's reply to a range with no bars in it
+NO_DATA_MESSAGES = ("no data",)
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _token_lock(token):
+    with _locks_guard:
+        if token not in _locks:
+            _locks[token] = threading.Lock()
+        return _locks[token]
+
+
+def bar_path(token):
+    """Return the Parquet file holding the bars of a token."""
+    return os.path.join(STORE_DIR, f"token={token}.parquet")
+
+
+def _empty_frame():
+    return pd.DataFrame(columns=BAR_COLUMNS)
+
+
+def _to_frame(historical_data):
+    """Normalize a get_historical response into a typed bar frame."""
+    if not isinstance(historical_data, pd.DataFrame):
+        # pya3 returns {'stat': 'Not_Ok', 'emsg': ...} on failure
+        if historical_data:
+            METRICS.count('broker_errors')
+            print(f"Historical fetch failed: {historical_data}")
+        return _empty_frame()
+
+    df = historical_data.reindex(columns=BAR_COLUMNS).dropna()
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    for col in BAR_COLUMNS[1:]:
+        df[col] = df[col].astype(float)
+    return df
+
+
+def _is_answer(historical_data):
+    """True if a get_historical response is bars or the broker saying there are none, not an error."""
+    if isinstance(historical_data, pd.DataFrame):
+        return True
+    message = str(historical_data.get('emsg') or "").lower() if isinstance(historical_data, dict) else ""
+    return any(m in message for m in NO_DATA_MESSAGES)
+
+
+def load_bars(token):
+    """Load all stored bars of a token, or an empty frame."""
+    path = bar_path(token)
+    if not os.path.exists(path):
+        return _empty_frame()
+    with METRICS.timer('bar_load', token):
+        return pd.read_parquet(path)
+
+
+def save_bars(token, df):
+    """Atomically replace the stored bars of a token."""
+    os.makedirs(STORE_DIR, exist_ok=True)
+    path = bar_path(token)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _merge(*frames):
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return _empty_frame()
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates(subset='datetime', keep='last')
+    return df.sort_values('datetime').reset_index(drop=True)
+
+
+def _is_fresh(token):
+    path = bar_path(token)
+    return os.path.exists(path) and time.time() - os.path.getmtime(path) < TOPUP_INTERVAL
+
+
+def expire_topups(tokens):
+    """Make the next get_bars of each token re-request its latest bars, however recent the last top-up."""
+    stale = time.time() - TOPUP_INTERVAL
+    for token in tokens:
+        path = bar_path(token)
+        if os.path.exists(path):
+            os.utime(path, (stale, stale))
+
+
+def _needs_head(stored, from_datetime):
+    """True if bars before the stored ones are wanted and were never asked for.
+
+    `fetched_from` (kept in the Parquet file's metadata) is the earliest date
+    the broker has been asked for; a recent listing has nothing before its
+    first bar, so once the head came back empty it is not requested again.
+    """
+    if stored.empty:
+        return True
+    fetched_from = stored.attrs.get('fetched_from')
+    if fetched_from is not None and from_datetime >= datetime.fromisoformat(fetched_from):
+        return False
+    return from_datetime < stored['datetime'].iloc[0] - timedelta(days=1)
+
+
+def missing_ranges(token, stored, from_datetime, to_datetime):
+    """Return the (from, to) ranges that must be fetched to complete the stored bars."""
+    if stored.empty:
+        return [(from_datetime, to_datetime)]
+
+    ranges = []
+    if _needs_head(stored, from_datetime):
+        ranges.append((from_datetime, stored['datetime'].iloc[0]))
+    if not _is_fresh(token):
+        # Re-request the last stored day too, it may have been a partial bar
+        ranges.append((stored['datetime'].iloc[-1], to_datetime))
+    return ranges
+
+
+def store_fetched(token, stored, fetched, from_datetime):
+    """Merge fetched get_historical responses into the store and return the requested window."""
+    with METRICS.timer('frame_build', token):
+        # The head range, if it was asked for, is the first response
+        head_answered = bool(fetched) and _needs_head(stored, from_datetime) and _is_answer(fetched[0])
+        fetched = [_to_frame(data) for data in fetched]
+        fetched_from = stored.attrs.get('fetched_from')
+        if any(not f.empty for f in fetched):
+            merged = _merge(stored, *fetched)
+        else:
+            merged = stored
+        if head_answered and not merged.empty:
+            # Whatever did not come back before the first bar does not exist
+            fetched_from = min(fetched_from or from_datetime.isoformat(), from_datetime.isoformat())
+        if merged is not stored or fetched_from != stored.attrs.get('fetched_from'):
+            merged = merged.copy()
+            if fetched_from is not None:
+                merged.attrs['fetched_from'] = fetched_from
+            save_bars(token, merged)
+        df = merged[merged['datetime'] >= from_datetime].reset_index(drop=True)
+    if df.empty:
+        METRICS.count('empty_histories')
+    return df
+
+
+def get_bars(alice, instrument, days):
+    """Return the last `days` calendar days of daily bars for an instrument.
+
+    Bars already on disk are reused; only the missing trailing days (and any
+    missing head, if more history is requested than is stored) are fetched.
+    """
+    token = instrument.token
+    to_datetime = datetime.now()
+    from_datetime = to_datetime - timedelta(days=days)
+
+    with _token_lock(token):
+        stored = load_bars(token)
+        fetched = []
+        for start, end in missing_ranges(token, stored, from_datetime, to_datetime):
+            with METRICS.timer('fetch', token):
+                response = alice.get_historical(instrument, start, end, "D")
+            if isinstance(response, dict) and is_session_message(response.get('emsg')):
+                raise session_rejected(alice, response.get('emsg'))
+            fetched.append(response)
+        return store_fetched(token, stored, fetched, from_datetime)
@@ -0,0 +1,174 @@
+"""Run every strategy over every stock list and save the results as a snapshot.
+
+Meant to run once after the market closes (e.g. from cron), so the app can
+serve results instantly instead of scanning on a user's request:
+
+    python batch_screener.py
+    python batch_screener.py --lists "NIFTY 50" --strategies "3-5% Gainers" --print
+
+Every stock list is a subset of the union of all tokens, and each token is
+screened independently, so the union is fetched and scanned once and the
+rows are then split per list. Results also go into the shared result cache.
+With --workers the scan is sharded over that many worker processes, each
+with its own broker session on the same account (they split its request
+rate), and --serve-queue lets workers on other hosts
+join in (see sharded_scan.py).
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from metrics import METRICS
+from nse_calendar import IST, MARKET_CLOSE, is_trading_day, last_completed_session
+from snapshots import FORMATS, SNAPSHOT_DIR, latest_snapshot, prune_snapshots, publish_snapshot, write_snapshot
+
+
+def connect(user_id=None, api_key=None):
+    """Broker session from explicit credentials, or the ones saved by the app today."""
+    from alice_client import create_session, initialize_alice
+
+    if not user_id or not api_key:
+        return initialize_alice()
+    return create_session(user_id, api_key)
+
+
+def run_batch(alice, list_names, strategy_names, processes=None, workers=0, shard_size=None, env=None,
+              serve=None):
+    """Scan the union of the lists once; returns ({list: {strategy: rows}}, metadata).
+
+    With `workers` or `serve`, `alice` is unused: the union is scanned by
+    that many local sharded_scan worker processes, which log in themselves
+    (with the credentials in `env`, if any), plus any remote workers that
+    connect to the queue served at `serve` ("host:port").
+    """
+    from instruments import resolve_stock_list
+    from result_cache import ResultCache
+    from scan_engine import scan_outcomes
+
+    METRICS.reset()
+    timings = {}
+    start = time.perf_counter()
+    universes = {name: resolve_stock_list(name) for name in list_names}
+    union = {}
+    for instruments in universes.values():
+        union.update((instrument.token, instrument) for instrument in instruments)
+    timings['resolve'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sharding = {}
+    if workers or serve:
+        from sharded_scan import SHARD_SIZE, run_sharded
+
+        outcomes, sharding = run_sharded(list(union.values()), strategy_names, workers,
+                                         shard_size or SHARD_SIZE, processes=processes, env=env, serve=serve)
+    else:
+        outcomes, _ = scan_outcomes(alice, list(union.values()), strategy_names, processes=processes)
+    timings['scan'] = time.perf_counter() - start
+
+    # Hand the results to the result cache, so live scans in the app are instant too
+    start = time.perf_counter()
+    failed = set()
+    for name, rows in outcomes.items():
+        failed.update(token for token in union if token not in rows)
+        ResultCache(name).store(rows)
+    timings['cache'] = time.perf_counter() - start
+
+    results = {}
+    for list_name, instruments in universes.items():
+        tokens = {instrument.token for instrument in instruments}
+        results[list_name] = {name: [row for token, row in outcomes[name].items()
+                                     if row is not None and token in tokens]
+                              for name in strategy_names}
+
+    metadata = {
+        'tokens': len(union),
+        'failed_tokens': len(failed),
+        'timings': timings,
+        'counters': METRICS.snapshot()['counters'],
+        **sharding,
+    }
+    return results, metadata
+
+
+def main():
+    from stock_lists import STOCK_LISTS
+    from scan_engine import STRATEGIES
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lists', nargs='+', default=list(STOCK_LISTS), choices=list(STOCK_LISTS))
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument('--format', default="parquet", choices=FORMATS)
+    parser.add_argument('--output-dir', default=SNAPSHOT_DIR)
+    parser.add_argument('--processes', type=int, default=None, help="compute pool size, 0 for in-process")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="shard the scan over this many worker processes, splitting the account's request rate")
+    parser.add_argument('--serve-queue', metavar='HOST:PORT',
+                        help="also serve the shard queue over HTTP for workers on other hosts")
+    parser.add_argument('--shard-size', type=int, default=None, help="tokens per shard with --workers")
+    parser.add_argument('--keep', type=int, default=30, help="number of snapshots to keep, 0 for all")
+    parser.add_argument('--user-id', help="AliceBlue user id (default: credentials saved by the app)")
+    parser.add_argument('--api-key', help="AliceBlue API key")
+    parser.add_argument('--force', action='store_true',
+                        help="scan even if the market is open or this session already has a snapshot")
+    parser.add_argument('--print', action='store_true', help="print Gainers/Losers tables for each list")
+    args = parser.parse_args()
+
+    now = datetime.datetime.now(IST)
+    session = last_completed_session(now)
+    if not args.force:
+        if is_trading_day(now.date()) and now.time() < MARKET_CLOSE:
+            print("Market is still open; today's bar is incomplete. Use --force to scan anyway.")
+            return 1
+        _, manifest = latest_snapshot(args.output_dir)
+        if manifest and manifest['session'] == str(session):
+            print(f"Snapshot for session {session} already exists. Use --force to rescan.")
+            return 0
+
+    started = time.perf_counter()
+    alice, env = None, None
+    if args.workers or args.serve_queue:
+        # Every worker logs in on its own; pass explicit credentials through the environment
+        if args.user_id and args.api_key:
+            env = dict(os.environ, ALICEBLUE_USER_ID=args.user_id, ALICEBLUE_API_KEY=args.api_key)
+    else:
+        try:
+            alice = connect(args.user_id, args.api_key)
+        except Exception as e:
+            print(f"Failed to initialize AliceBlue API: {e}")
+            return 1
+
+    results, metadata = run_batch(alice, args.lists, args.strategies, args.processes,
+                                  args.workers, args.shard_size, env, args.serve_queue)
+
+    start = time.perf_counter()
+    run_id = now.strftime('%Y%m%dT%H%M%S')
+    run_dir, files = write_snapshot(session, run_id, results, args.format, args.output_dir)
+    METRICS.to_json(os.path.join(run_dir, "metrics.json"))
+    metadata['timings']['write'] = time.perf_counter() - start
+    metadata['timings']['total'] = time.perf_counter() - started
+    metadata.update(created=now.isoformat(timespec='seconds'), session=str(session), run_id=run_id,
+                    format=args.format, results=files)
+    publish_snapshot(run_dir, metadata, args.output_dir)
+    if args.keep:
+        prune_snapshots(args.keep, args.output_dir)
+
+    if args.print:
+        from utils import print_stocks_down, print_stocks_up
+
+        for list_name, by_strategy in results.items():
+            print(f"\n=== {list_name} ===")
+            if "3-5% Gainers" in by_strategy:
+                print_stocks_up(by_strategy["3-5% Gainers"])
+            if "3-5% Losers" in by_strategy:
+                print_stocks_down(by_strategy["3-5% Losers"])
+
+    timings = ', '.join(f"{k} {v:.1f}s" for k, v in metadata['timings'].items())
+    print(f"Snapshot for session {session} written to {run_dir} "
+          f"({metadata['tokens']} tokens, {metadata['failed_tokens']} failed; {timings})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Micro-benchmark of support-zone detection.
+
+Times `support.find_support_cluster` against the previous argrelextrema and
+linear-clustering implementation on synthetic random walks. The reference
+needs scipy, which the app itself no longer depends on. Run from the
+repository root:
+
+    python benchmarks/bench_support.py --series 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.signal import argrelextrema
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from support import find_support_cluster, local_minima  # noqa: E402
+
+
+def legacy_support_cluster(close_prices, volumes):
+    """The argrelextrema + linear clustering implementation this module replaced."""
+    # What MinMaxScaler did, without pulling in scikit-learn for it
+    low, high = close_prices.min(), close_prices.max()
+    normalized_prices = (close_prices - low) / (high - low) if high > low else np.zeros_like(close_prices)
+
+    window_size = max(int(len(close_prices) * 0.05), 5)
+    local_min = argrelextrema(normalized_prices, np.less_equal, order=window_size)[0]
+
+    valid_supports = []
+    for m in local_min:
+        if m < len(close_prices) - 126:  # Older than 6 months
+            continue
+        support_price = close_prices[m]
+        current_price = close_prices[-1]
+
+        if 1.05 <= (current_price / support_price) <= 1.20:
+            if volumes[-1] > volumes[m] * 0.8:
+                valid_supports.append({
+                    'price': support_price,
+                    'date': m,
+                    'touches': 1
+                })
+
+    if not valid_supports:
+        return None
+
+    support_clusters = []
+    tolerance = np.std(close_prices) * 0.3
+    for sup in valid_supports:
+        found = False
+        for cluster in support_clusters:
+            if abs(sup['price'] - cluster['price']) <= tolerance:
+                cluster['count'] += 1
+                found = True
+                break
+        if not found:
+            support_clusters.append({
+                'price': sup['price'],
+                'count': 1,
+                'dates': [sup['date']]
+            })
+
+    if not support_clusters:
+        return None
+
+    return max(support_clusters, key=lambda x: x['count'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--series', type=int, default=2000)
+    parser.add_argument('--length', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    series = [(100 * np.exp(np.cumsum(rng.normal(0, 0.02, args.length))),
+               rng.integers(1_000, 50_000, args.length).astype(float)) for _ in range(args.series)]
+
+    mismatched_minima = 0
+    for close, _ in series[:200]:
+        order = max(int(len(close) * 0.05), 5)
+        expected = argrelextrema(close, np.less_equal, order=order)[0]
+        expected = expected[expected >= len(close) - 126]
+        mismatched_minima += not np.array_equal(expected, local_minima(close, order, len(close) - 126))
+
+    start = time.perf_counter()
+    old = [legacy_support_cluster(close, volume) for close, volume in series]
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = [find_support_cluster(close, volume) for close, volume in series]
+    new_time = time.perf_counter() - start
+
+    same_hits = sum((a is None) == (b is None) for a, b in zip(old, new))
+    print(f"local minima mismatches: {mismatched_minima}/200")
+    print(f"same support/no-support outcome: {same_hits}/{len(series)}")
+    print(f"legacy: {old_time / len(series) * 1e6:.0f} us/series  "
+          f"new: {new_time / len(series) * 1e6:.0f} us/series  "
+          f"speedup: {old_time / new_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
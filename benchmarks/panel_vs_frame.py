@@ -0,0 +1,75 @@
+"""Compare the panel screen against the per-token DataFrame path.
+
+Run from the repository root:
+
+    python benchmarks/panel_vs_frame.py --tokens 1872
+"""
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scan_engine import STRATEGIES, _window, screen_frames  # noqa: E402
+
+Instrument = namedtuple('Instrument', ['exchange', 'token', 'symbol', 'name', 'expiry', 'lot_size'])
+
+
+def synthetic_frames(n_tokens, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_days)
+    frames = []
+    for token in range(n_tokens):
+        # Vary history length so the validity mask is exercised
+        n = n_days if token % 7 else rng.integers(50, n_days)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+        df = pd.DataFrame({
+            'datetime': dates[-n:],
+            'open': close, 'high': close, 'low': close, 'close': close,
+            'volume': rng.integers(1_000, 50_000, n).astype(float),
+        })
+        frames.append((Instrument('NSE', token, f'S{token}', f'S{token}-EQ', '', 1), df))
+    return frames
+
+
+def frame_path(frames, strategies):
+    results = {}
+    for s in strategies:
+        rows = (s.evaluate(instrument, _window(df, s.lookback_days)) for instrument, df in frames)
+        results[s.name] = [row for row in rows if row is not None]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=500)
+    parser.add_argument('--days', type=int, default=500)
+    args = parser.parse_args()
+
+    frames = synthetic_frames(args.tokens, args.days)
+    strategies = list(STRATEGIES.values())
+
+    start = time.perf_counter()
+    expected = frame_path(frames, strategies)
+    frame_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = screen_frames(frames, strategies)
+    panel_time = time.perf_counter() - start
+
+    for name in expected:
+        want = {row['Token'] for row in expected[name]}
+        got = {row['Token'] for row in actual[name]}
+        status = "ok" if want == got else f"MISMATCH ({len(want ^ got)} tokens differ)"
+        print(f"{name:<25} {len(got):>5} hits  {status}")
+    print(f"DataFrame path: {frame_time:.3f}s  panel path: {panel_time:.3f}s  "
+          f"speedup: {frame_time / panel_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Scan benchmarks against a synthetic broker, reported as JSON.
+
+Times analyze_all_tokens, the Gainers/Losers scans behind the app's
+fetch_screened_stocks, and the individual stages (fetch, DataFrame build,
+indicators, support detection) for universes drawn from STOCK_LISTS. Run
+from the repository root:
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json
+
+Bars and indicator state are kept in a temporary directory, so the stored
+history under data/ is never touched.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+UNIVERSES = (50, 500, 1872)
+
+
+def _isolate_storage():
+    scratch = tempfile.mkdtemp(prefix="screener-bench-")
+    os.environ["BAR_STORE_DIR"] = os.path.join(scratch, "bars")
+    os.environ["INDICATOR_STATE_FILE"] = os.path.join(scratch, "indicator_state.npz")
+    return scratch
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def universe(size):
+    """The first `size` tokens of ALL STOCKS as instruments (synthetic if not in NSE.csv)."""
+    from instruments import Instrument, get_registry
+    from stock_lists import STOCK_LISTS
+
+    registry = get_registry()
+    tokens = STOCK_LISTS["ALL STOCKS"][:size]
+    return [registry.get(t) or Instrument('NSE', t, f"SYM{t}", f"SYM{t}-EQ", '', 1, 0.05, '')
+            for t in tokens]
+
+
+def _reset(scratch):
+    import scan_engine
+
+    scan_engine.clear_session_frames()
+    shutil.rmtree(os.path.join(scratch, "bars"), ignore_errors=True)
+    if os.path.exists(os.environ["INDICATOR_STATE_FILE"]):
+        os.remove(os.environ["INDICATOR_STATE_FILE"])
+
+
+def bench_universe(instruments, broker, scratch, processes):
+    import bar_store
+    import scan_engine
+    from panel import build_panel, screen_indicators
+    from stock_analysis import analyze_all_tokens
+    from support import find_support_cluster
+
+    timings = {}
+
+    _reset(scratch)
+    timings['analyze_all_tokens_cold'], signals = _timed(analyze_all_tokens, broker, instruments)
+    scan_engine.clear_session_frames()
+    timings['analyze_all_tokens_warm'], _ = _timed(analyze_all_tokens, broker, instruments)
+
+    for name in ("3-5% Gainers", "3-5% Losers"):
+        key = name.split()[1].lower()
+        _reset(scratch)
+        timings[f'{key}_cold'], _ = _timed(scan_engine.scan_tokens, broker, instruments, [name],
+                                           processes=processes)
+        scan_engine.clear_session_frames()
+        timings[f'{key}_warm'], _ = _timed(scan_engine.scan_tokens, broker, instruments, [name],
+                                           processes=processes)
+
+    # Per-stage costs, each measured in isolation
+    _reset(scratch)
+    timings['stage_fetch_cold'], frames = _timed(scan_engine.fetch_frames, broker, instruments, 730)
+    scan_engine.clear_session_frames()
+    timings['stage_fetch_warm'], _ = _timed(scan_engine.fetch_frames, broker, instruments, 730)
+
+    now = datetime.now()
+    raw = [broker.get_historical(instrument, now - timedelta(days=730), now, "D")
+           for instrument in instruments[:50]]
+    elapsed, _ = _timed(lambda: [bar_store._to_frame(r) for r in raw])
+    timings['stage_dataframe_build_per_token'] = elapsed / len(raw)
+
+    timings['stage_panel_build'], panel = _timed(build_panel, frames)
+    timings['stage_indicators'], _ = _timed(screen_indicators, panel)
+    rows = [panel.row(i) for i in range(len(panel))]
+    timings['stage_support_detection'], _ = _timed(lambda: [find_support_cluster(c, v) for c, v in rows])
+    timings['stage_frame_indicators'], _ = _timed(
+        lambda: [(df['close'].ewm(span=50).mean(), df['close'].ewm(span=200).mean()) for _, df in frames])
+
+    return {
+        'tokens': len(instruments),
+        'signals': len(signals),
+        'timings': {k: round(v, 6) for k, v in timings.items()},
+        'broker_calls': broker.calls,
+        'broker_failures': broker.failures,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """Print the relative change of every timing against a previous report."""
+    for size, result in current['universes'].items():
+        before = previous.get('universes', {}).get(size)
+        if not before:
+            continue
+        print(f"\n{size} tokens")
+        for key, value in result['timings'].items():
+            old = before['timings'].get(key)
+            if old:
+                print(f"  {key:<34} {old:>10.4f}s -> {value:>10.4f}s  ({(value / old - 1) * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(UNIVERSES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per historical request")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--rate', type=float, default=1000.0, help="client token-bucket rate (requests/s)")
+    parser.add_argument('--processes', type=int, default=None, help="compute pool size, 0 for in-process")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--compare', help="previous JSON report to compare against")
+    args = parser.parse_args()
+
+    scratch = _isolate_storage()
+
+    import async_client
+    from synthetic_broker import SyntheticBroker
+
+    async_client.SHARED_BUCKET.rate = async_client.SHARED_BUCKET.capacity = args.rate
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'universes': {},
+    }
+    for size in args.sizes:
+        broker = SyntheticBroker(args.seed, args.latency, args.jitter, args.failure_rate)
+        report['universes'][str(size)] = bench_universe(universe(size), broker, scratch, args.processes)
+        print(f"{size} tokens done", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
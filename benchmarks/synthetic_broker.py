@@ -0,0 +1,49 @@
+"""In-process stand-in for `pya3.Aliceblue` serving deterministic market data."""
+import os
+import random
+import sys
+import threading
+import time
+
+import pandas as pd
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_broker import Instrument, random_walk_bars  # noqa: E402
+
+
+class SyntheticBroker:
+    """Seeded random-walk OHLCV for any token, with configurable latency and failures.
+
+    `get_historical` sleeps `latency` +/- `jitter` seconds and raises a
+    requests.ConnectionError with probability `failure_rate`, which the async
+    client retries like a dropped connection.
+    """
+
+    def __init__(self, seed=0, latency=0.0, jitter=0.0, failure_rate=0.0):
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get_instrument_by_token(self, exchange, token):
+        return Instrument(exchange, token, f"SYM{token}", f"SYM{token}-EQ", '', 1)
+
+    def get_historical(self, instrument, from_datetime, to_datetime, interval):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.failure_rate
+            self.failures += failed
+        time.sleep(delay)
+        if failed:
+            raise requests.ConnectionError(f"synthetic failure for token {instrument.token}")
+
+        bars = random_walk_bars(instrument.token, from_datetime, to_datetime, self.seed)
+        df = pd.DataFrame(bars, columns=['time', 'open', 'high', 'low', 'close', 'volume'])
+        return df.rename(columns={'time': 'datetime'})
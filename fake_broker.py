@@ -0,0 +1,352 @@
+"""Local stand-ins for the AliceBlue REST API and tick feed.
+
+    server = FakeBrokerServer(latency=0.05, throttle_rate=0.1).start()
+    ticks = FakeTickServer(ticks_per_second=500).start()
+    alice = FakeAlice(server.base_url, socket_url=ticks.url)
+    ...
+    ticks.stop()
+    server.stop()
+"""
+import base64
+import hashlib
+import json
+import random
+import socketserver
+import struct
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+Instrument = namedtuple('Instrument', ['exchange', 'token', 'symbol', 'name', 'expiry', 'lot_size'])
+
+
+def _walk(token, to_date, seed):
+    # Anchor the walk at a fixed date and draw each series from its own
+    # generator, so overlapping requests agree on every day's prices and volume
+    days = np.arange(np.datetime64('2015-01-01'), np.datetime64(to_date) + 1)
+    returns = np.random.default_rng([seed, int(token)]).normal(0.0005, 0.02, len(days))
+    close = 100 * np.exp(np.cumsum(returns))
+    volume = np.random.default_rng([seed, int(token), 1]).integers(10_000, 1_000_000, len(days))
+    return days, close, volume, returns
+
+
+def previous_close(token, day, seed=0):
+    """Close of the last weekday bar before `day`, as served by random_walk_bars."""
+    days, close, _, _ = _walk(token, day - timedelta(days=1), seed)
+    weekdays = np.flatnonzero(np.is_busday(days))
+    return round(float(close[weekdays[-1]]), 2)
+
+
+def random_walk_bars(token, from_datetime, to_datetime, seed=0):
+    """Deterministic daily OHLCV bars for a token, one per weekday in the range."""
+    days, close, volume, returns = _walk(token, to_datetime.date(), seed)
+
+    bars = []
+    for day, c, v, r in zip(days, close, volume, returns):
+        day = day.astype(datetime)
+        if day.weekday() >= 5 or day < from_datetime.date():
+            continue
+        open_ = c / np.exp(r)
+        bars.append({
+            'time': f"{day:%Y-%m-%d} 00:00:00",
+            'open': round(float(open_), 2),
+            'high': round(float(max(open_, c) * 1.01), 2),
+            'low': round(float(min(open_, c) * 0.99), 2),
+            'close': round(float(c), 2),
+            'volume': int(v),
+        })
+    return bars
+
+
+class FakeBrokerServer:
+    """Threaded HTTP server answering chart/history with random-walk bars.
+
+    Each request sleeps `latency` +/- `jitter` seconds. Requests are answered
+    with HTTP 429 at random with probability `throttle_rate`, and always when
+    they exceed `rate_limit` requests per second (if set). Requests made with
+    a session id in `expired_sessions` are refused with HTTP 401.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, throttle_rate=0.0, rate_limit=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.seed = seed
+        self.stats = {'requests': 0, 'throttled': 0, 'connections': 0}
+        self.expired_sessions = set()
+        self._window = []
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/"
+
+    def _throttle(self):
+        with self._lock:
+            self.stats['requests'] += 1
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            self._window.append(now)
+            throttled = (self._random.random() < self.throttle_rate
+                         or (self.rate_limit is not None and len(self._window) > self.rate_limit))
+            if throttled:
+                self.stats['throttled'] += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        return throttled, delay
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is observable
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.stats['connections'] += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                throttled, delay = server._throttle()
+                time.sleep(delay)
+
+                if throttled:
+                    self._reply(429, {'stat': 'Not_Ok', 'emsg': 'Too many requests'})
+                elif self.headers.get('Authorization', '').rpartition(' ')[2] in server.expired_sessions:
+                    self._reply(401, {'stat': 'Not_Ok', 'emsg': 'Session Expired'})
+                elif not self.path.endswith('chart/history'):
+                    self._reply(404, {'stat': 'Not_Ok', 'emsg': 'Unknown endpoint'})
+                else:
+                    from_datetime = datetime.fromtimestamp(int(body['from']) / 1000)
+                    to_datetime = datetime.fromtimestamp(int(body['to']) / 1000)
+                    bars = random_walk_bars(body['token'], from_datetime, to_datetime, server.seed)
+                    self._reply(200, {'stat': 'Ok', 'result': bars})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _ws_send(sock, text):
+    payload = text.encode()
+    if len(payload) < 126:
+        header = struct.pack('!BB', 0x81, len(payload))
+    elif len(payload) < 1 << 16:
+        header = struct.pack('!BBH', 0x81, 126, len(payload))
+    else:
+        header = struct.pack('!BBQ', 0x81, 127, len(payload))
+    sock.sendall(header + payload)
+
+
+def _ws_recv(rfile):
+    """Read one client frame; returns (opcode, payload) or (None, None) at EOF."""
+    header = rfile.read(2)
+    if len(header) < 2:
+        return None, None
+    opcode, length = header[0] & 0x0F, header[1] & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', rfile.read(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', rfile.read(8))
+    mask = rfile.read(4) if header[1] & 0x80 else b'\0\0\0\0'
+    data = rfile.read(length)
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+
+class FakeTickServer:
+    """Websocket server speaking the subset of the AliceBlue tick protocol pya3 uses.
+
+    After a client sends its connect message ('t': 'c') and subscribes
+    ('t': 't', 'k': 'NSE|22#NSE|1594'), every token gets a touchline message
+    ('tk') with its previous close from random_walk_bars, then random-walk
+    feed messages ('tf') arrive at `ticks_per_second` across all subscriptions.
+    """
+
+    def __init__(self, ticks_per_second=100, seed=0, day=None):
+        self.ticks_per_second = ticks_per_second
+        self.seed = seed
+        self.day = day or date.today()
+        self.stats = {'connections': 0, 'ticks': 0, 'subscribed': 0}
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"ws://{host}:{port}/"
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                if not self._handshake():
+                    return
+                with server._lock:
+                    server.stats['connections'] += 1
+                self.send_lock = threading.Lock()
+                self.prices = {}  # token -> [prev close, last price, volume]
+                self.closed = threading.Event()
+                threading.Thread(target=self._stream, daemon=True).start()
+                try:
+                    while True:
+                        opcode, payload = _ws_recv(self.rfile)
+                        if opcode in (None, 0x8):
+                            break
+                        if opcode == 0x1:
+                            self._on_message(json.loads(payload))
+                finally:
+                    self.closed.set()
+
+            def _handshake(self):
+                headers = {}
+                self.rfile.readline()
+                for line in iter(self.rfile.readline, b'\r\n'):
+                    if not line:
+                        return False
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + _WS_GUID).encode()).digest())
+                self.wfile.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                                 b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+                return True
+
+            def _send(self, message):
+                with self.send_lock:
+                    _ws_send(self.request, json.dumps(message))
+
+            def _on_message(self, message):
+                if message.get('t') == 'c':
+                    self._send({'t': 'ck', 's': 'OK'})
+                elif message.get('t') in ('t', 'd'):
+                    for script in message['k'].split('#'):
+                        exchange, _, token = script.partition('|')
+                        close = previous_close(token, server.day, server.seed)
+                        self.prices[token] = [close, close, 0]
+                        self._send({'t': 'tk', 'e': exchange, 'tk': token, 'c': str(close), 'lp': str(close),
+                                    'pc': '0.00', 'v': '0'})
+                    with server._lock:
+                        server.stats['subscribed'] = len(self.prices)
+                elif message.get('t') in ('u', 'ud'):
+                    for script in message['k'].split('#'):
+                        self.prices.pop(script.partition('|')[2], None)
+
+            def _stream(self):
+                rng = random.Random(server.seed)
+                interval = 0.01
+                while not self.closed.wait(interval):
+                    tokens = list(self.prices)
+                    if not tokens:
+                        continue
+                    try:
+                        for _ in range(max(1, int(server.ticks_per_second * interval))):
+                            token = rng.choice(tokens)
+                            state = self.prices.get(token)
+                            if state is None:
+                                continue
+                            state[1] = round(state[1] * (1 + rng.gauss(0, 0.004)), 2)
+                            state[2] += rng.randint(100, 10_000)
+                            self._send({'t': 'tf', 'e': 'NSE', 'tk': token, 'lp': str(state[1]),
+                                        'pc': f"{(state[1] / state[0] - 1) * 100:.2f}", 'v': str(state[2])})
+                            with server._lock:
+                                server.stats['ticks'] += 1
+                    except OSError:
+                        return
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeAlice:
+    """Minimal Aliceblue look-alike whose REST calls go to a FakeBrokerServer
+    and whose websocket connects to a FakeTickServer."""
+
+    def __init__(self, base_url, user_id='FAKE', session_id='fake-session', socket_url=None):
+        self.base_url = base_url
+        self.user_id = user_id
+        self.session_id = session_id
+        self.socket_url = socket_url
+        self.ws = None
+
+    def _user_agent(self):
+        return "fake-broker"
+
+    def _user_authorization(self):
+        return f"Bearer {self.user_id} {self.session_id}"
+
+    def get_instrument_by_token(self, exchange, token):
+        return Instrument(exchange, token, f"SYM{token}", f"SYM{token}-EQ", '', 1)
+
+    def get_historical(self, instrument, from_datetime, to_datetime, interval):
+        from async_client import HistoryClient
+        return HistoryClient(self).get_historical(instrument, from_datetime, to_datetime, interval)
+
+    def start_websocket(self, socket_open_callback=None, socket_close_callback=None, socket_error_callback=None,
+                        subscription_callback=None, check_subscription_callback=None, run_in_background=False,
+                        market_depth=False):
+        import websocket
+
+        def on_open(ws):
+            ws.send(json.dumps({'t': 'c', 'uid': f"{self.user_id}_API", 'source': 'API'}))
+            if socket_open_callback:
+                socket_open_callback()
+
+        self.ws = websocket.WebSocketApp(
+            self.socket_url, on_open=on_open,
+            on_message=lambda ws, message: subscription_callback and subscription_callback(message),
+            on_close=lambda *args: socket_close_callback and socket_close_callback(),
+            on_error=lambda ws, error: socket_error_callback and socket_error_callback(error))
+        if run_in_background:
+            threading.Thread(target=self.ws.run_forever, daemon=True).start()
+        else:
+            self.ws.run_forever()
+
+    def subscribe(self, instruments):
+        self.ws.send(json.dumps({'k': '#'.join(f"{i.exchange}|{i.token}" for i in instruments), 't': 't'}))
+
+    def unsubscribe(self, instruments):
+        self.ws.send(json.dumps({'k': '#'.join(f"{i.exchange}|{i.token}" for i in instruments), 't': 'u'}))
+
+    def stop_websocket(self):
+        if self.ws:
+            self.ws.close()
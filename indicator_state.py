@@ -0,0 +1,231 @@
+import datetime
+import os
+
+import numpy as np
+
+STATE_FILE = os.environ.get("INDICATOR_STATE_FILE", os.path.join("data", "indicator_state.npz"))
+
+EMA_SPANS = (50, 200)
+RSI_WINDOW = 14
+# Closes kept per token to drop bars leaving the window; 730 calendar days hold about 500 NSE sessions
+WINDOW_BARS = 560
+
+
+class IndicatorStates:
+    """Recurrence state of EMA-50/200 and RSI-14 for many tokens, one row per token.
+
+    Each EMA is kept as the numerator and denominator of pandas' adjusted
+    weighting, and RSI as the ring of its last 14 price changes, so a new bar
+    updates a token in O(1). Only completed sessions (bars before today) are
+    committed; today's possibly partial bar is applied provisionally when the
+    indicators are read.
+
+    A row covers the bars from `first_date` to `last_date`, which follows the
+    window of the panels it is advanced with: every panel must hold the full
+    lookback the indicators are read over. The row's last WINDOW_BARS closes
+    are kept in a ring (`closes`, slot `count % WINDOW_BARS` is next), so bars
+    that leave the window are dropped without reading them back from disk.
+    """
+
+    def __init__(self, tokens=None, first_date=None, last_date=None, last_close=None,
+                 bars=None, ema_num=None, ema_den=None, deltas=None, closes=None, count=None):
+        n = 0 if tokens is None else len(tokens)
+        self.tokens = np.zeros(0, dtype=np.int64) if tokens is None else tokens
+        self.first_date = _or(first_date, np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]'))
+        self.last_date = _or(last_date, np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]'))
+        self.last_close = _or(last_close, np.full(n, np.nan))
+        self.bars = _or(bars, np.zeros(n, dtype=np.int64))
+        self.ema_num = _or(ema_num, np.zeros((n, len(EMA_SPANS))))
+        self.ema_den = _or(ema_den, np.zeros((n, len(EMA_SPANS))))
+        self.deltas = _or(deltas, np.full((n, RSI_WINDOW), np.nan))
+        self.closes = _or(closes, np.full((n, WINDOW_BARS), np.nan))
+        self.count = _or(count, np.zeros(n, dtype=np.int64))
+        self._index = {int(t): i for i, t in enumerate(self.tokens)}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def rows(self, tokens):
+        """Return the state row of each token, adding empty rows for new tokens."""
+        new = [int(t) for t in dict.fromkeys(tokens) if int(t) not in self._index]
+        if new:
+            grown = IndicatorStates(np.array(new, dtype=np.int64))
+            for name in STATE_ARRAYS:
+                setattr(self, name, np.concatenate([getattr(self, name), getattr(grown, name)]))
+            self._index = {int(t): i for i, t in enumerate(self.tokens)}
+        return np.array([self._index[int(t)] for t in tokens], dtype=np.int64)
+
+    def update(self, other, tokens):
+        """Copy the rows of `tokens` from another IndicatorStates."""
+        mine, theirs = self.rows(tokens), other.rows(tokens)
+        for name in STATE_ARRAYS[1:]:
+            getattr(self, name)[mine] = getattr(other, name)[theirs]
+
+    def advance(self, panel, today=None):
+        """Fold every completed bar of the panel not yet seen into the state.
+
+        Rows whose panel history starts later than their state (the window
+        moved on) drop the bars that left it. Rows whose panel history starts
+        earlier (more bars became available), or whose dropped bars are no
+        longer in the ring, are rebuilt from the panel. Returns the number of
+        bars consumed.
+        """
+        rows = self.rows([instrument.token for instrument in panel.instruments])
+        self._align(panel, rows)
+        cutoff = np.datetime64(today or datetime.date.today(), 'ns')
+        last = self.last_date[rows][:, None]
+        # Tokens seen for the first time take their whole history
+        new = panel.mask & (panel.dates < cutoff) & ((panel.dates > last) | np.isnat(last))
+
+        columns = np.flatnonzero(new.any(axis=0))
+        for j in columns:
+            m = new[:, j]
+            r = rows[m]
+            self._step(r, panel.close[m, j])
+            self.last_date[r] = panel.dates[m, j]
+            self.first_date[r] = np.where(np.isnat(self.first_date[r]), panel.dates[m, j], self.first_date[r])
+        return int(new.sum())
+
+    def _align(self, panel, rows):
+        """Make each row start at its token's first panel bar."""
+        has = panel.mask.any(axis=1)
+        first = panel.dates[np.arange(len(panel)), panel.mask.argmax(axis=1)]
+        known = has & (self.bars[rows] > 0)
+        reset = known & (first < self.first_date[rows])
+        for i in np.flatnonzero(known & (first > self.first_date[rows])):
+            r = rows[i]
+            kept = panel.mask[i] & (panel.dates[i] <= self.last_date[r])
+            if not self._drop_before(r, first[i], panel.close[i, kept]):
+                reset[i] = True
+        r = rows[reset]
+        self.first_date[r] = self.last_date[r] = np.datetime64('NaT')
+        self.last_close[r] = np.nan
+        self.bars[r] = self.count[r] = 0
+        self.ema_num[r] = self.ema_den[r] = 0.0
+        self.deltas[r] = np.nan
+        self.closes[r] = np.nan
+
+    def _drop_before(self, r, start, kept):
+        """Make row r start at `start`, keeping only the closes `kept`; False if the ring cannot."""
+        dropped = self.bars[r] - len(kept)
+        # Every folded bar must still be in the ring, the newest of them must be
+        # the kept closes, and RSI needs a full ring of changes left
+        if (self.bars[r] > min(self.count[r], WINDOW_BARS) or dropped < 0 or len(kept) <= RSI_WINDOW
+                or not np.array_equal(self._ring(r, len(kept)), kept)):
+            return False
+        closes = self._ring(r, self.bars[r])[:dropped]
+        # Bar p of the row (0 = oldest) carries weight decay ** (bars - 1 - p)
+        ages = self.bars[r] - 1 - np.arange(dropped)
+        weights = _decays()[None, :] ** ages[:, None]
+        self.ema_num[r] -= (weights * closes[:, None]).sum(axis=0)
+        self.ema_den[r] -= weights.sum(axis=0)
+        self.bars[r] = len(kept)
+        self.first_date[r] = start
+        return True
+
+    def _ring(self, r, n):
+        """The last n closes folded into row r, oldest first."""
+        return self.closes[r, (self.count[r] - n + np.arange(n)) % WINDOW_BARS]
+
+    def _step(self, r, close):
+        delta = np.where(self.bars[r] > 0, close - self.last_close[r], 0.0)
+        self.deltas[r, :-1] = self.deltas[r, 1:]
+        self.deltas[r, -1] = delta
+        decay = _decays()
+        self.ema_num[r] = close[:, None] + decay * self.ema_num[r]
+        self.ema_den[r] = 1 + decay * self.ema_den[r]
+        self.last_close[r] = close
+        self.closes[r, self.count[r] % WINDOW_BARS] = close
+        self.count[r] += 1
+        self.bars[r] += 1
+
+    def indicators(self, panel):
+        """Return ema_50, ema_200 and rsi at each token's latest panel bar.
+
+        Bars newer than the committed state (today's) are applied on a copy, so
+        reading the indicators never changes the state.
+        """
+        rows = self.rows([instrument.token for instrument in panel.instruments])
+        provisional = IndicatorStates(
+            self.tokens[rows], self.first_date[rows].copy(), self.last_date[rows].copy(),
+            self.last_close[rows].copy(), self.bars[rows].copy(), self.ema_num[rows].copy(),
+            self.ema_den[rows].copy(), self.deltas[rows].copy(), self.closes[rows].copy(),
+            self.count[rows].copy())
+        last = provisional.last_date[:, None]
+        pending = panel.mask & ((panel.dates > last) | np.isnat(last))
+        for j in np.flatnonzero(pending.any(axis=0)):
+            m = np.flatnonzero(pending[:, j])
+            provisional._step(m, panel.close[m, j])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ema = provisional.ema_num / provisional.ema_den
+            gain = np.where(provisional.deltas > 0, provisional.deltas, 0.0).mean(axis=1)
+            loss = np.where(provisional.deltas < 0, -provisional.deltas, 0.0).mean(axis=1)
+            rsi = 100 - 100 / (1 + gain / loss)
+        rsi[provisional.bars < RSI_WINDOW] = np.nan
+        return {'ema_50': ema[:, 0], 'ema_200': ema[:, 1], 'rsi': rsi}
+
+    def verify(self, load_bars, since, tokens=None, rtol=1e-9):
+        """Check the committed state against a recompute over the strategy's window.
+
+        `load_bars(token)` must return the token's full bar history; the
+        indicators are recomputed, as find_buy_signal does, over its bars from
+        `since` up to the last committed one. Returns a list of
+        (token, indicator, incremental, recomputed) mismatches.
+        """
+        from stock_analysis import compute_rsi
+
+        mismatches = []
+        for token in (self.tokens if tokens is None else tokens):
+            i = self._index.get(int(token))
+            if i is None or self.bars[i] == 0:
+                continue
+            df = load_bars(int(token))
+            dates = df['datetime'].to_numpy(dtype='datetime64[ns]')
+            closes = df['close'][(dates >= np.datetime64(since, 'ns')) & (dates <= self.last_date[i])]
+
+            expected = {f'ema_{span}': closes.ewm(span=span).mean().iloc[-1] for span in EMA_SPANS}
+            expected['rsi'] = compute_rsi(closes) if len(closes) >= RSI_WINDOW else np.nan
+            actual = {f'ema_{span}': self.ema_num[i, k] / self.ema_den[i, k] for k, span in enumerate(EMA_SPANS)}
+            actual['rsi'] = self._rsi(i)
+            for name, want in expected.items():
+                if not np.isclose(actual[name], want, rtol=rtol, equal_nan=True):
+                    mismatches.append((int(token), name, actual[name], want))
+        return mismatches
+
+    def _rsi(self, i):
+        if self.bars[i] < RSI_WINDOW:
+            return np.nan
+        deltas = self.deltas[i]
+        gain = np.where(deltas > 0, deltas, 0.0).mean()
+        loss = np.where(deltas < 0, -deltas, 0.0).mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 100 - 100 / (1 + gain / loss)
+
+
+STATE_ARRAYS = ('tokens', 'first_date', 'last_date', 'last_close', 'bars',
+                'ema_num', 'ema_den', 'deltas', 'closes', 'count')
+
+
+def _or(value, default):
+    return default if value is None else value
+
+
+def _decays():
+    return np.array([1 - 2 / (span + 1) for span in EMA_SPANS])
+
+
+def load_states(path=STATE_FILE):
+    """Load the persisted indicator states, or empty states."""
+    if not os.path.exists(path):
+        return IndicatorStates()
+    with np.load(path, allow_pickle=False) as data:
+        return IndicatorStates(**{name: data[name] for name in data.files})
+
+
+def save_states(states, path=STATE_FILE):
+    """Atomically persist indicator states."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **{name: getattr(states, name) for name in STATE_ARRAYS})
+    os.replace(tmp_path, path)
@@ -0,0 +1,126 @@
+import csv
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from metrics import METRICS
+from stock_lists import STOCK_LISTS
+
+CONTRACT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NSE.csv")
+CACHE_FILE = os.path.join("data", "instruments.npz")
+
+# Field-compatible with pya3's Instrument (exchange, token, symbol, name, expiry,
+# lot_size) so it can be passed straight to get_historical and subscribe.
+Instrument = namedtuple('Instrument', ['exchange', 'token', 'symbol', 'name', 'expiry',
+                                       'lot_size', 'tick_size', 'company'])
+
+_COLUMNS = ['exchange', 'symbol', 'name', 'company', 'group', 'lot_size', 'tick_size']
+
+
+class InstrumentRegistry:
+    """Contract master held as token-sorted NumPy columns.
+
+    Token lookups are binary searches over `tokens`; symbol lookups go through a
+    dict built once at load time.
+    """
+
+    def __init__(self, tokens, columns):
+        self.tokens = tokens
+        self.columns = columns
+        self._by_symbol = {}
+        # Prefer the EQ series when a symbol is listed under several groups
+        for i in np.argsort(columns['group'] != 'EQ', kind='stable'):
+            self._by_symbol.setdefault(columns['symbol'][i], int(tokens[i]))
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def _instrument(self, i):
+        c = self.columns
+        return Instrument(str(c['exchange'][i]), int(self.tokens[i]), str(c['symbol'][i]),
+                          str(c['name'][i]), '', int(c['lot_size'][i]), float(c['tick_size'][i]),
+                          str(c['company'][i]))
+
+    def _positions(self, tokens):
+        tokens = np.asarray(tokens, dtype=np.int64)
+        pos = np.searchsorted(self.tokens, tokens).clip(max=len(self.tokens) - 1)
+        return pos, self.tokens[pos] == tokens
+
+    def get(self, token):
+        """Return the Instrument for a token, or None if it is not in the master."""
+        pos, found = self._positions([token])
+        return self._instrument(pos[0]) if found[0] else None
+
+    def token_for(self, symbol):
+        """Return the token of an NSE symbol (e.g. 'RELIANCE'), or None."""
+        return self._by_symbol.get(symbol.upper())
+
+    def resolve(self, tokens):
+        """Return Instruments for tokens, skipping tokens missing from the master."""
+        with METRICS.timer('instrument_lookup'):
+            pos, found = self._positions(tokens)
+            instruments = [self._instrument(i) for i in pos[found]]
+        if not found.all():
+            METRICS.count('missing_instruments', int((~found).sum()))
+            print(f"Skipping {int((~found).sum())} tokens not found in {os.path.basename(CONTRACT_FILE)}")
+        return instruments
+
+
+def _parse_contract_file(path):
+    rows = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            rows.append((int(row['Token']), row['Exch'], row['Symbol'], row['Trading Symbol'],
+                         row['Instrument Name'], row['Group Name'],
+                         int(float(row['Lot Size'] or 1)), float(row['Tick Size'] or 0.05)))
+    rows.sort()
+
+    tokens = np.array([r[0] for r in rows], dtype=np.int64)
+    columns = {
+        'exchange': np.array([r[1] for r in rows]),
+        'symbol': np.array([r[2] for r in rows]),
+        'name': np.array([r[3] for r in rows]),
+        'company': np.array([r[4] for r in rows]),
+        'group': np.array([r[5] for r in rows]),
+        'lot_size': np.array([r[6] for r in rows], dtype=np.int32),
+        'tick_size': np.array([r[7] for r in rows], dtype=np.float64),
+    }
+    return tokens, columns
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+
+def load_registry(path=CONTRACT_FILE, cache_file=CACHE_FILE):
+    """Build the registry from the contract master, using the binary cache when current."""
+    stamp = _source_stamp(path)
+    if os.path.exists(cache_file):
+        with np.load(cache_file, allow_pickle=False) as cached:
+            if np.array_equal(cached['stamp'], stamp):
+                return InstrumentRegistry(cached['tokens'], {c: cached[c] for c in _COLUMNS})
+
+    tokens, columns = _parse_contract_file(path)
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_file, stamp=stamp, tokens=tokens, **columns)
+    os.replace(tmp_file, cache_file)
+    return InstrumentRegistry(tokens, columns)
+
+
+_registry = None
+
+
+def get_registry():
+    """Return the process-wide registry, loading it on first use."""
+    global _registry
+    if _registry is None:
+        _registry = load_registry()
+    return _registry
+
+
+def resolve_stock_list(list_name):
+    """Return the Instruments of a named list in STOCK_LISTS."""
+    return get_registry().resolve(STOCK_LISTS.get(list_name, []))
@@ -0,0 +1,256 @@
+"""Intraday screening from the broker's websocket ticks.
+
+Daily history is loaded once (through the bar store) for the completed
+sessions; from then on every tick only updates today's bar of its own token
+and re-checks that token's Gainers/Losers change and support distance, so a
+tick costs the same with 50 or 1,800 subscribed symbols.
+
+    feed = LiveFeed(alice).start()
+    feed.watch(resolve_stock_list("ALL STOCKS"))
+    feed.screener.gainers()
+
+`alice` is a pya3 Aliceblue session, or fake_broker.FakeAlice pointed at a
+FakeTickServer for testing.
+"""
+import json
+import threading
+from datetime import date
+
+import numpy as np
+
+from metrics import METRICS
+from panel import build_panel, screen_indicators
+from stock_analysis import DEFAULT_PARAMS, _buy_signal_row
+from support import strongest_cluster, support_levels
+
+LOOKBACK_DAYS = 730
+# Tokens per subscribe message, well below the broker's message size limit
+SUBSCRIBE_BATCH = 500
+
+
+class LiveScreener:
+    """Today's bar for each token on top of its daily history, with live screen results.
+
+    Per-token state lives in NumPy arrays indexed by position; the support
+    levels, EMA trend and RSI come from the completed sessions and stay fixed
+    during the day, while price, change and support distance follow the ticks.
+    """
+
+    def __init__(self, params=DEFAULT_PARAMS, today=None):
+        self.params = params
+        self.gain = (params.change_low, params.change_high)
+        self.loss = (-params.change_high, -params.change_low)
+        self.today = np.datetime64(today or date.today(), 'D')
+        self.instruments = []
+        self._index = {}
+        self._levels = []
+        self._lock = threading.Lock()
+        self.prev_close = np.empty(0)
+        self.open = np.empty(0)
+        self.high = np.empty(0)
+        self.low = np.empty(0)
+        self.last = np.empty(0)
+        self.volume = np.empty(0)
+        self.change = np.empty(0)
+        self.rsi = np.empty(0)
+        self.ema_50 = np.empty(0)
+        self.ema_200 = np.empty(0)
+        self.signal_ok = np.empty(0, dtype=bool)
+        self.gainer_set = set()
+        self.loser_set = set()
+        self.support = {}  # position -> best cluster dict
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def __contains__(self, token):
+        return int(token) in self._index
+
+    def add(self, frames):
+        """Start tracking [(instrument, df), ...] of daily bars; known tokens are skipped."""
+        frames = [(instrument, df) for instrument, df in frames if int(instrument.token) not in self._index]
+        if not frames:
+            return
+        # Only completed sessions count as history; today's bar comes from the ticks
+        history = [(instrument, df[df['datetime'].to_numpy(dtype='datetime64[D]') < self.today])
+                   for instrument, df in frames]
+        panel = build_panel(history)
+        indicators = screen_indicators(panel)
+
+        levels = []
+        for i in range(len(panel)):
+            close, volume = panel.row(i)
+            if len(close) == 0:
+                levels.append(None)
+                continue
+            minima = support_levels(close, self.params.lookback, self.params.window_pct, self.params.min_window)
+            levels.append((close[minima], volume[minima], np.std(close) * self.params.tolerance_std))
+
+        n = len(frames)
+        prev_close = np.full(n, np.nan)
+        if panel.close.shape[1]:
+            prev_close = panel.close[:, -1].copy()
+        with self._lock:
+            start = len(self.instruments)
+            for k, (instrument, _) in enumerate(frames):
+                self._index[int(instrument.token)] = start + k
+            self.instruments.extend(instrument for instrument, _ in frames)
+            self._levels.extend(levels)
+            self.prev_close = np.concatenate([self.prev_close, prev_close])
+            for name in ('open', 'high', 'low', 'last', 'change'):
+                setattr(self, name, np.concatenate([getattr(self, name), np.full(n, np.nan)]))
+            self.volume = np.concatenate([self.volume, np.zeros(n)])
+            self.rsi = np.concatenate([self.rsi, indicators['rsi']])
+            self.ema_50 = np.concatenate([self.ema_50, indicators['ema_50']])
+            self.ema_200 = np.concatenate([self.ema_200, indicators['ema_200']])
+            # The trend, RSI and history-length rules of find_buy_signal do not change intraday
+            ok = ((panel.lengths >= self.params.min_bars) & indicators['trend_ok']
+                  & ~(indicators['rsi'] > self.params.rsi_max))
+            self.signal_ok = np.concatenate([self.signal_ok, ok])
+
+    def update(self, token, price=None, volume=None, prev_close=None):
+        """Apply one tick to a token's bar and re-evaluate that token only."""
+        k = self._index.get(int(token))
+        if k is None:
+            return
+        with self._lock:
+            if prev_close and np.isnan(self.prev_close[k]):
+                self.prev_close[k] = prev_close
+            if volume is not None:
+                self.volume[k] = volume
+            if price:
+                if np.isnan(self.open[k]):
+                    self.open[k] = self.high[k] = self.low[k] = price
+                self.high[k] = max(self.high[k], price)
+                self.low[k] = min(self.low[k], price)
+                self.last[k] = price
+            self._evaluate(k)
+
+    def _evaluate(self, k):
+        price = self.last[k]
+        if np.isnan(price):
+            return
+        change = self.change[k] = (price / self.prev_close[k] - 1) * 100
+        for members, (low, high) in ((self.gainer_set, self.gain), (self.loser_set, self.loss)):
+            if low <= change <= high:
+                members.add(k)
+            else:
+                members.discard(k)
+
+        levels = self._levels[k]
+        best = None
+        if self.signal_ok[k] and levels is not None:
+            best = strongest_cluster(levels[0], levels[1], price, self.volume[k], levels[2],
+                                     (self.params.band_low, self.params.band_high), self.params.volume_ratio)
+        if best is None:
+            self.support.pop(k, None)
+        else:
+            self.support[k] = {'price': best[0], 'count': best[1]}
+
+    def on_message(self, message):
+        """Websocket callback: apply a raw touchline ('tk') or feed ('tf') message."""
+        data = json.loads(message)
+        if data.get('t') not in ('tk', 'tf') or 'tk' not in data:
+            return
+        METRICS.count('ticks')
+        self.update(data['tk'],
+                    price=float(data['lp']) if data.get('lp') else None,
+                    volume=float(data['v']) if data.get('v') else None,
+                    prev_close=float(data['c']) if data.get('c') else None)
+
+    def last_bar(self, token):
+        """Today's bar of a token built from the ticks so far, or None."""
+        k = self._index.get(int(token))
+        if k is None or np.isnan(self.last[k]):
+            return None
+        with self._lock:
+            return {'open': self.open[k], 'high': self.high[k], 'low': self.low[k],
+                    'close': self.last[k], 'volume': self.volume[k]}
+
+    def _change_rows(self, members, tokens):
+        with self._lock:
+            rows = [{
+                'Name': self.instruments[k].name,
+                'Token': self.instruments[k].token,
+                'Close': self.last[k],
+                'Change (%)': self.change[k],
+            } for k in members if tokens is None or self.instruments[k].token in tokens]
+        return sorted(rows, key=lambda row: -abs(row['Change (%)']))
+
+    def gainers(self, tokens=None):
+        """Rows of tokens currently up by the params' change band, optionally only for `tokens`."""
+        return self._change_rows(self.gainer_set, tokens)
+
+    def losers(self, tokens=None):
+        """Rows of tokens currently down by the params' change band, optionally only for `tokens`."""
+        return self._change_rows(self.loser_set, tokens)
+
+    def buy_signals(self, tokens=None):
+        """Rows of find_buy_signal candidates at the live price."""
+        with self._lock:
+            return [_buy_signal_row(self.instruments[k], [self.last[k]], cluster,
+                                    self.rsi[k], self.ema_50[k], self.ema_200[k])
+                    for k, cluster in self.support.items()
+                    if tokens is None or self.instruments[k].token in tokens]
+
+
+class LiveFeed:
+    """Keeps a LiveScreener current from a broker session's websocket."""
+
+    def __init__(self, alice, screener=None):
+        self.alice = alice
+        self.screener = screener or LiveScreener()
+        self.connected = threading.Event()
+        self._subscribed = set()
+        self._loading = set()  # tokens whose history a watch call is fetching
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.alice.start_websocket(socket_open_callback=self._on_open,
+                                   socket_close_callback=self._on_close,
+                                   socket_error_callback=self._on_error,
+                                   subscription_callback=self.screener.on_message,
+                                   run_in_background=True)
+        return self
+
+    def stop(self):
+        self.alice.stop_websocket()
+
+    def _on_open(self):
+        self.connected.set()
+        # Resubscribe everything after a reconnect
+        with self._lock:
+            instruments = [i for i in self.screener.instruments if int(i.token) in self._subscribed]
+        self._subscribe(instruments)
+
+    def _on_close(self):
+        self.connected.clear()
+
+    def _on_error(self, error):
+        if isinstance(error, Exception):
+            METRICS.exception(error)
+        print(f"Live feed error: {error}")
+
+    def _subscribe(self, instruments):
+        for start in range(0, len(instruments), SUBSCRIBE_BATCH):
+            self.alice.subscribe(instruments[start:start + SUBSCRIBE_BATCH])
+
+    def watch(self, instruments, days=LOOKBACK_DAYS):
+        """Load history for instruments not tracked yet and subscribe to their ticks."""
+        from scan_engine import fetch_frames
+
+        with self._lock:
+            new = [i for i in instruments if int(i.token) not in self._subscribed | self._loading]
+            self._loading.update(int(i.token) for i in new)
+        if not new:
+            return
+        try:
+            self.screener.add(fetch_frames(self.alice, new, days))
+        finally:
+            # Tokens whose history could not be fetched are tried again by the next watch
+            with self._lock:
+                self._loading.difference_update(int(i.token) for i in new)
+                added = [i for i in new if i.token in self.screener]
+                self._subscribed.update(int(i.token) for i in added)
+        if self.connected.is_set():
+            self._subscribe(added)
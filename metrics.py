@@ -0,0 +1,144 @@
+"""Stage timings and error counters collected while scanning.
+
+Code on the scan path reports into the process-wide METRICS:
+
+    with METRICS.timer('fetch', instrument.token):
+        data = alice.get_historical(...)
+    METRICS.count('retries')
+    METRICS.exception(e)
+
+Each stage gets a latency histogram and, when a token is given, a per-token
+total, so a slow scan can be traced to the broker or to our own compute.
+`METRICS.snapshot()` is plain JSON-serializable data.
+"""
+import contextlib
+import json
+import threading
+import time
+
+STAGES = ('instrument_lookup', 'bar_load', 'fetch', 'frame_build', 'indicators', 'support')
+
+# Upper bucket bounds in seconds, 0.5ms doubling up to ~65s; the last bucket is open
+BUCKETS = tuple(0.0005 * 2 ** i for i in range(18))
+
+
+class Histogram:
+    """Latency histogram over fixed, exponentially growing buckets."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (self.max,), self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max)
+        return 0.0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': self.max,
+            'buckets': dict(zip([f"<={b:g}" for b in BUCKETS] + ['inf'], self.counts)),
+        }
+
+    def merge(self, data):
+        self.counts = [a + b for a, b in zip(self.counts, data['buckets'].values())]
+        self.count += data['count']
+        self.total += data['total']
+        self.max = max(self.max, data['max'])
+
+
+class Metrics:
+    """Thread-safe stage histograms, per-token stage totals and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.histograms = {}
+            self.tokens = {}
+            self.counters = {}
+
+    def observe(self, stage, seconds, token=None):
+        with self._lock:
+            self.histograms.setdefault(stage, Histogram()).observe(seconds)
+            if token is not None:
+                timings = self.tokens.setdefault(int(token), {})
+                timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timer(self, stage, token=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, token)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def exception(self, error):
+        """Count an exception by type, e.g. 'exception.ConnectionError'."""
+        self.count(f"exception.{type(error).__name__}")
+
+    def slowest(self, stage, n=10):
+        """The n tokens that spent longest in a stage, as [(token, seconds)]."""
+        with self._lock:
+            timings = [(token, t[stage]) for token, t in self.tokens.items() if stage in t]
+        return sorted(timings, key=lambda item: -item[1])[:n]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'elapsed': time.time() - self.started,
+                'counters': dict(self.counters),
+                'stages': {stage: h.to_dict() for stage, h in self.histograms.items()},
+                'tokens': {str(token): dict(t) for token, t in self.tokens.items()},
+            }
+
+    def merge(self, snapshot):
+        """Add the measurements of another process's snapshot to this one."""
+        with self._lock:
+            for name, n in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for stage, data in snapshot['stages'].items():
+                self.histograms.setdefault(stage, Histogram()).merge(data)
+            for token, stages in snapshot['tokens'].items():
+                timings = self.tokens.setdefault(int(token), {})
+                for stage, seconds in stages.items():
+                    timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def to_json(self, path=None):
+        text = json.dumps(self.snapshot(), indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+METRICS = Metrics()
@@ -0,0 +1,54 @@
+import datetime
+import os
+
+HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nse_holidays.txt")
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+MARKET_CLOSE = datetime.time(15, 30)
+
+_holidays = None
+
+
+def holidays():
+    """Return the set of NSE trading holidays listed in nse_holidays.txt."""
+    global _holidays
+    if _holidays is None:
+        dates = set()
+        if os.path.exists(HOLIDAYS_FILE):
+            with open(HOLIDAYS_FILE) as f:
+                for line in f:
+                    line = line.split('#')[0].strip()
+                    if line:
+                        dates.add(datetime.date.fromisoformat(line))
+        year = datetime.datetime.now(IST).year
+        if not any(day.year == year for day in dates):
+            print(f"Warning: {HOLIDAYS_FILE} lists no NSE holidays for {year}; "
+                  "every weekday is treated as a trading day until they are added.")
+        _holidays = dates
+    return _holidays
+
+
+def is_trading_day(day):
+    """True if NSE is open on `day`."""
+    return day.weekday() < 5 and day not in holidays()
+
+
+def previous_trading_day(day):
+    """The last trading day strictly before `day`."""
+    day -= datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day -= datetime.timedelta(days=1)
+    return day
+
+
+def last_completed_session(now=None):
+    """The date of the most recent NSE session that has closed.
+
+    End-of-day bars only change when a session closes, so this is the natural
+    version key for anything computed from them.
+    """
+    now = (now or datetime.datetime.now(IST)).astimezone(IST)
+    today = now.date()
+    if is_trading_day(today) and now.time() >= MARKET_CLOSE:
+        return today
+    return previous_trading_day(today)
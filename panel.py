@@ -0,0 +1,129 @@
+import numpy as np
+
+
+class Panel:
+    """Daily bars of many tokens packed into aligned 2-D arrays (tokens x days).
+
+    Rows are right-aligned by bar position, so column -1 holds every token's
+    latest bar and shorter histories are NaN-padded on the left. `mask` marks
+    the real bars.
+    """
+
+    def __init__(self, instruments, close, volume, dates, mask):
+        self.instruments = instruments
+        self.close = close
+        self.volume = volume
+        self.dates = dates  # datetime64[ns], NaT where padded
+        self.mask = mask
+        self.lengths = mask.sum(axis=1)
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def row(self, i):
+        """Return the unpadded (close, volume) arrays of one token."""
+        start = self.close.shape[1] - self.lengths[i]
+        return self.close[i, start:], self.volume[i, start:]
+
+
+def build_panel(frames, length=None):
+    """Pack [(instrument, df), ...] into a Panel of at most `length` trailing bars."""
+    frames = list(frames)
+    width = max((len(df) for _, df in frames), default=0)
+    if length is not None:
+        width = min(width, length)
+
+    close = np.full((len(frames), width), np.nan)
+    volume = np.full((len(frames), width), np.nan)
+    dates = np.full((len(frames), width), np.datetime64('NaT'), dtype='datetime64[ns]')
+    mask = np.zeros((len(frames), width), dtype=bool)
+
+    for i, (_, df) in enumerate(frames):
+        n = min(len(df), width)
+        if n == 0:
+            continue
+        close[i, -n:] = df['close'].to_numpy(dtype=float)[-n:]
+        volume[i, -n:] = df['volume'].to_numpy(dtype=float)[-n:]
+        dates[i, -n:] = df['datetime'].to_numpy(dtype='datetime64[ns]')[-n:]
+        mask[i, -n:] = True
+
+    return Panel([instrument for instrument, _ in frames], close, volume, dates, mask)
+
+
+def ema(values, mask, span):
+    """Column-wise equivalent of pandas `Series.ewm(span=span).mean()` for every row.
+
+    Uses the adjusted (adjust=True) weighting; each row starts at its first
+    valid bar.
+    """
+    decay = 1 - 2 / (span + 1)
+    out = np.full(values.shape, np.nan)
+    num = np.zeros(values.shape[0])
+    den = np.zeros(values.shape[0])
+    for j in range(values.shape[1]):
+        valid = mask[:, j]
+        num = np.where(valid, values[:, j] + decay * num, num)
+        den = np.where(valid, 1 + decay * den, den)
+        out[valid, j] = num[valid] / den[valid]
+    return out
+
+
+def rsi(values, mask, window=14):
+    """Row-wise equivalent of `compute_rsi` over the whole series (simple moving averages)."""
+    delta = np.diff(values, axis=1, prepend=np.nan)
+    delta[~mask] = np.nan
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    # Like pandas, the first bar's undefined delta counts as a zero move
+    gain[~mask] = 0.0
+    loss[~mask] = 0.0
+
+    def rolling_mean(a):
+        c = np.cumsum(a, axis=1)
+        out = np.full(a.shape, np.nan)
+        out[:, window - 1] = c[:, window - 1]
+        out[:, window:] = c[:, window:] - c[:, :-window]
+        return out / window
+
+    avg_gain = rolling_mean(gain)
+    avg_loss = rolling_mean(loss)
+    # Windows that reach into the padding are undefined
+    counts = np.cumsum(mask, axis=1)
+    avg_gain[counts < window] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        return 100 - 100 / (1 + rs)
+
+
+def pct_change(values):
+    """Percent change of the last bar over the one before it, per row."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (values[:, -1] - values[:, -2]) / values[:, -2] * 100
+
+
+def screen_indicators(panel, states=None):
+    """Compute the universe-wide indicators used by the screening strategies.
+
+    With `states` (an IndicatorStates), EMA and RSI are advanced incrementally
+    from the persisted recurrences instead of recomputed over the whole panel.
+    """
+    if not panel.close.shape[1]:
+        # No bars at all, e.g. every fetch failed
+        missing = np.full(len(panel), np.nan)
+        return {'pct_change': missing, 'ema_50': missing, 'ema_200': missing, 'rsi': missing,
+                'trend_ok': np.zeros(len(panel), dtype=bool)}
+    if states is not None:
+        states.advance(panel)
+        recurrent = states.indicators(panel)
+        ema_50, ema_200, last_rsi = recurrent['ema_50'], recurrent['ema_200'], recurrent['rsi']
+    else:
+        ema_50 = ema(panel.close, panel.mask, 50)[:, -1]
+        ema_200 = ema(panel.close, panel.mask, 200)[:, -1]
+        last_rsi = rsi(panel.close, panel.mask)[:, -1] if panel.close.shape[1] >= 14 else np.full(len(panel), np.nan)
+    return {
+        'pct_change': pct_change(panel.close) if panel.close.shape[1] >= 2 else np.full(len(panel), np.nan),
+        'ema_50': ema_50,
+        'ema_200': ema_200,
+        'rsi': last_rsi,
+        'trend_ok': ema_50 >= ema_200,
+    }
@@ -0,0 +1,197 @@
+"""Two-stage scan: concurrent bar fetching feeding a process pool of screeners.
+
+The I/O stage runs the rate-limited AsyncBroker in a background event loop
+and packs fetched frames into panel batches. Batches pass through a bounded
+queue, so fetching pauses when the compute stage falls behind. The compute
+stage copies each batch into one shared-memory block and screens it in a
+ProcessPoolExecutor, so the CPU-heavy support search runs outside the GIL
+and large arrays are never pickled.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from async_client import DEFAULT_CONCURRENCY, AsyncBroker
+from metrics import METRICS
+from panel import Panel, build_panel
+
+BATCH_SIZE = 64
+QUEUE_BATCHES = 4
+
+_FIELDS = (('close', np.float64), ('volume', np.float64), ('dates', 'datetime64[ns]'), ('mask', np.bool_))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(workers=None):
+    """Return the process-wide screening pool, starting it on first use."""
+    global _pool, _pool_workers
+    workers = workers or os.cpu_count() or 1
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn, since forking a process that runs threads can deadlock
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def _layout(shape):
+    offsets, offset = {}, 0
+    for name, dtype in _FIELDS:
+        offsets[name] = offset
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return offsets, max(offset, 1)
+
+
+def _attach(shm, shape):
+    offsets, _ = _layout(shape)
+    return {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offsets[name])
+            for name, dtype in _FIELDS}
+
+
+def share_panel(panel):
+    """Copy a panel's arrays into a new shared-memory block; returns (shm, shape)."""
+    shape = panel.close.shape
+    shm = shared_memory.SharedMemory(create=True, size=_layout(shape)[1])
+    for name, array in _attach(shm, shape).items():
+        array[...] = getattr(panel, name)
+    return shm, shape
+
+
+def _screen_shared_batch(shm_name, shape, instruments, indicators, strategy_names):
+    """Process-pool task: screen one shared-memory panel batch.
+
+    Returns ({strategy name: rows}, metrics snapshot of this batch).
+    """
+    from scan_engine import STRATEGIES, _window
+
+    METRICS.reset()
+    # Pool workers share the parent's resource tracker, which unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        arrays = _attach(shm, shape)
+        panel = Panel(instruments, arrays['close'], arrays['volume'], arrays['dates'], arrays['mask'])
+        results = {}
+        for name in strategy_names:
+            strategy = STRATEGIES[name]
+            if strategy.screen is not None:
+                results[name] = strategy.screen(panel, indicators)
+                continue
+            rows = []
+            for i, instrument in enumerate(instruments):
+                close, volume = panel.row(i)
+                n = len(close)
+                df = pd.DataFrame({'datetime': panel.dates[i, len(panel.dates[i]) - n:],
+                                   'close': close, 'volume': volume})
+                row = strategy.evaluate(instrument, _window(df, strategy.lookback_days))
+                if row is not None:
+                    rows.append(row)
+            results[name] = rows
+        del panel, arrays
+        return results, METRICS.snapshot()
+    finally:
+        shm.close()
+
+
+def _fetch_batches(alice, instruments, days, batches, max_workers, batch_size):
+    """I/O stage: fetch frames and put panel batches on the bounded `batches` queue."""
+    from scan_engine import _fetch_frame
+
+    async def produce():
+        broker = AsyncBroker(alice, max_concurrency=max_workers)
+        frames = asyncio.Queue(maxsize=batch_size * QUEUE_BATCHES)
+
+        async def fetch(instrument):
+            try:
+                await frames.put(await _fetch_frame(broker, instrument, days))
+            except Exception as e:
+                METRICS.exception(e)
+                print(f"Error fetching token {instrument.token}: {e}")
+                await frames.put(None)
+
+        tasks = [asyncio.ensure_future(fetch(instrument)) for instrument in instruments]
+        batch = []
+        try:
+            for _ in instruments:
+                frame = await frames.get()
+                if frame is not None:
+                    batch.append(frame)
+                if len(batch) == batch_size:
+                    await asyncio.to_thread(batches.put, batch)
+                    batch = []
+            if batch:
+                await asyncio.to_thread(batches.put, batch)
+        finally:
+            for task in tasks:
+                task.cancel()
+            broker.close()
+            batches.put(None)
+
+    asyncio.run(produce())
+
+
+def run_pipeline(alice, instruments, strategies, days, states=None, processes=None,
+                 max_workers=DEFAULT_CONCURRENCY, batch_size=BATCH_SIZE):
+    """Fetch and screen instruments with overlapping I/O and multi-process compute.
+
+    `strategies` are Strategy objects. `states` (an IndicatorStates) is advanced
+    in this process, since it is cheap; the per-batch strategy screens run in
+    the pool. Returns {strategy name: rows}.
+    """
+    from panel import screen_indicators
+
+    processes = processes or os.cpu_count() or 1
+    pool = get_process_pool(processes)
+    batches = queue.Queue(maxsize=QUEUE_BATCHES)
+    producer = threading.Thread(target=_fetch_batches, daemon=True,
+                                args=(alice, list(instruments), days, batches, max_workers, batch_size))
+    producer.start()
+
+    names = [s.name for s in strategies]
+    results = {name: [] for name in names}
+    in_flight = {}
+
+    def collect(done):
+        for future in done:
+            shm = in_flight.pop(future)
+            try:
+                batch_results, batch_metrics = future.result()
+                for name, rows in batch_results.items():
+                    results[name].extend(rows)
+                METRICS.merge(batch_metrics)
+            except Exception as e:
+                METRICS.exception(e)
+                print(f"Error screening batch: {e}")
+            finally:
+                shm.close()
+                shm.unlink()
+
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        panel = build_panel(batch)
+        with METRICS.timer('indicators'):
+            indicators = screen_indicators(panel, states)
+        shm, shape = share_panel(panel)
+        future = pool.submit(_screen_shared_batch, shm.name, shape, panel.instruments, indicators, names)
+        in_flight[future] = shm
+        # Bound the shared memory held by batches waiting for a worker
+        if len(in_flight) >= 2 * processes:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    collect(wait(in_flight)[0])
+    producer.join()
+    return results
@@ -0,0 +1,202 @@
+"""Scan results shared by every Streamlit worker through one SQLite file.
+
+Results are stored per token under (strategy, parameters, session), where
+session is the last completed NSE session, so they stay valid until the next
+close and overlapping universes (NIFTY 50 inside NIFTY 500) reuse each
+other's tokens. Workers claim the tokens they are about to compute with a
+lease; anyone asking for the same tokens meanwhile waits for those results
+instead of hitting the broker again.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from nse_calendar import last_completed_session
+
+CACHE_FILE = os.environ.get("RESULT_CACHE_FILE", os.path.join("data", "results.sqlite"))
+
+# Leases are renewed while their owner computes; one not renewed within this
+# time is assumed to belong to a dead worker or an interrupted session.
+LEASE_SECONDS = 60
+POLL_SECONDS = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    token INTEGER NOT NULL,
+    strategy TEXT NOT NULL,
+    params TEXT NOT NULL,
+    session TEXT NOT NULL,
+    row TEXT,
+    PRIMARY KEY (token, strategy, params, session)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    token INTEGER NOT NULL,
+    strategy TEXT NOT NULL,
+    params TEXT NOT NULL,
+    session TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (token, strategy, params, session)
+);
+"""
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class ResultCache:
+    """Per-token scan results for one (strategy, params) pair in the current session."""
+
+    def __init__(self, strategy, params=None, path=CACHE_FILE, session=None):
+        self.strategy = strategy
+        self.params = json.dumps(params or {}, sort_keys=True, default=_to_json)
+        self.session = str(session or last_completed_session())
+        self.path = path
+        self.owner = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+        self.purge()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _key(self, token):
+        return (int(token), self.strategy, self.params, self.session)
+
+    def lookup(self, tokens):
+        """Return ({token: row or None} for cached tokens, [tokens not cached])."""
+        tokens = [int(t) for t in tokens]
+        cached = {}
+        with self._connect() as db:
+            for start in range(0, len(tokens), 500):
+                chunk = tokens[start:start + 500]
+                query = (f"SELECT token, row FROM results WHERE strategy = ? AND params = ? AND session = ? "
+                         f"AND token IN ({','.join('?' * len(chunk))})")
+                for token, row in db.execute(query, (self.strategy, self.params, self.session, *chunk)):
+                    cached[token] = json.loads(row) if row is not None else None
+        return cached, [t for t in tokens if t not in cached]
+
+    def claim(self, tokens):
+        """Lease the tokens nobody else is computing; returns the ones now owned."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+            db.executemany("INSERT OR IGNORE INTO leases VALUES (?, ?, ?, ?, ?, ?)",
+                           [(*self._key(t), self.owner, now + LEASE_SECONDS) for t in tokens])
+            owned = {token for token, in db.execute(
+                "SELECT token FROM leases WHERE owner = ?", (self.owner,))}
+        return [int(t) for t in tokens if int(t) in owned]
+
+    def renew(self, tokens):
+        """Extend this owner's leases on tokens."""
+        with self._connect() as db:
+            db.executemany("UPDATE leases SET expires = ? WHERE token = ? AND strategy = ? AND params = ? "
+                           "AND session = ? AND owner = ?",
+                           [(time.time() + LEASE_SECONDS, *self._key(t), self.owner) for t in tokens])
+
+    @contextlib.contextmanager
+    def leasing(self, tokens):
+        """Renew the leases on claimed tokens while the block runs, and release
+        the ones not stored when it ends, however it ends."""
+        tokens = list(tokens)
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(LEASE_SECONDS / 3):
+                self.renew(tokens)
+
+        threading.Thread(target=renew, daemon=True).start()
+        try:
+            yield
+        finally:
+            done.set()
+            self.release(tokens)
+
+    def store(self, rows):
+        """Save {token: row or None} and release their leases."""
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                           [(*self._key(t), None if row is None else json.dumps(row, default=_to_json))
+                            for t, row in rows.items()])
+            db.executemany("DELETE FROM leases WHERE token = ? AND strategy = ? AND params = ? "
+                           "AND session = ? AND owner = ?",
+                           [(*self._key(t), self.owner) for t in rows])
+
+    def evict(self, tokens):
+        """Forget the stored results of tokens, so the next scan computes them again."""
+        with self._connect() as db:
+            db.executemany("DELETE FROM results WHERE token = ? AND strategy = ? AND params = ? AND session = ?",
+                           [self._key(t) for t in tokens])
+
+    def release(self, tokens):
+        """Drop leases on tokens that could not be computed."""
+        with self._connect() as db:
+            db.executemany("DELETE FROM leases WHERE token = ? AND strategy = ? AND params = ? "
+                           "AND session = ? AND owner = ?",
+                           [(*self._key(t), self.owner) for t in tokens])
+
+    def leased(self, tokens):
+        """Return the tokens currently leased by another worker."""
+        tokens = {int(t) for t in tokens}
+        with self._connect() as db:
+            rows = db.execute("SELECT token FROM leases WHERE strategy = ? AND params = ? AND session = ? "
+                              "AND owner != ? AND expires >= ?",
+                              (self.strategy, self.params, self.session, self.owner, time.time()))
+            return {token for token, in rows} & tokens
+
+    def purge(self):
+        """Delete results of sessions before the current one."""
+        with self._connect() as db:
+            db.execute("DELETE FROM results WHERE session < ?", (self.session,))
+
+
+def cached_scan(instruments, strategy, compute, params=None, cache=None):
+    """Return the rows of `strategy` over instruments, computing only what is not cached.
+
+    `compute(instruments)` must return ({token: row or None}, failed_tokens) for
+    the instruments it is given. Tokens being computed by another worker are
+    waited for rather than recomputed; failed tokens are not cached.
+    """
+    cache = cache or ResultCache(strategy, params)
+    by_token = {instrument.token: instrument for instrument in instruments}
+    results, missing = cache.lookup(by_token)
+    failed = set()
+
+    while missing:
+        mine = cache.claim(missing)
+        if mine:
+            with cache.leasing(mine):
+                rows, mine_failed = compute([by_token[t] for t in mine])
+                done = {t: rows.get(t) for t in mine if t not in mine_failed}
+                cache.store(done)
+            results.update(done)
+            failed.update(mine_failed)
+            missing = [t for t in missing if t not in done and t not in failed]
+
+        # The rest is leased by other workers; wait for their results or for
+        # the leases to lapse, in which case the next round claims them
+        while missing and cache.leased(missing):
+            time.sleep(POLL_SECONDS)
+            found, missing = cache.lookup(missing)
+            results.update(found)
+        found, missing = cache.lookup(missing)
+        results.update(found)
+
+    return [row for row in results.values() if row is not None]
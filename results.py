@@ -0,0 +1,71 @@
+"""Screen results stored column-wise for display.
+
+A ResultTable keeps each column of a strategy's rows as one typed NumPy
+array, plus an upper-cased copy of the names, so searching is a single
+vectorized substring test and sorting is an argsort instead of work on
+lists of dicts.
+
+The strategies still return one row dict per hit. The result cache, the shard
+queue, snapshots and streaming scans all store and merge results per token.
+Rows become columns once, in ResultTable.from_rows or from_frame, before
+display.
+"""
+import numpy as np
+import pandas as pd
+
+TRADINGVIEW_URL = "https://in.tradingview.com/chart?symbol=NSE%3A"
+
+# (column, dtype) in display order
+CHANGE_COLUMNS = (('Name', str), ('Token', np.int64), ('Close', np.float64), ('Change (%)', np.float64))
+SIGNAL_COLUMNS = (('Token', np.int64), ('Name', str), ('Price', np.float64), ('Support', np.float64),
+                  ('Strength', np.int64), ('Distance%', np.float64), ('RSI', np.float64), ('Trend', str))
+
+
+class ResultTable:
+    """The rows of one strategy as {column: array}, all of the same length."""
+
+    def __init__(self, columns, schema, search_index=None):
+        self.columns = columns
+        self.schema = schema
+        if search_index is None:
+            search_index = np.char.upper(columns['Name'].astype(str))
+        self.search_index = search_index
+
+    @classmethod
+    def from_rows(cls, rows, schema):
+        """Build a table from row dicts such as those returned by the strategies."""
+        return cls({name: np.array([row[name] for row in rows], dtype=dtype) for name, dtype in schema}, schema)
+
+    @classmethod
+    def from_frame(cls, df, schema):
+        """Build a table from a DataFrame holding the schema's columns."""
+        return cls({name: df[name].to_numpy(dtype=dtype) if name in df else np.array([], dtype=dtype)
+                    for name, dtype in schema}, schema)
+
+    def __len__(self):
+        return len(self.search_index)
+
+    def take(self, index):
+        """A new table with the rows at `index` (a boolean mask or positions)."""
+        return ResultTable({name: values[index] for name, values in self.columns.items()},
+                           self.schema, self.search_index[index])
+
+    def search(self, text):
+        """Rows whose name contains `text`, case-insensitively."""
+        text = text.strip().upper()
+        if not text:
+            return self
+        return self.take(np.char.find(self.search_index, text) >= 0)
+
+    def top(self, n, keys):
+        """The first n rows ordered by `keys`, a list of (column, descending)."""
+        # lexsort sorts by its last key first
+        order = np.lexsort([-self.columns[name] if descending else self.columns[name]
+                            for name, descending in reversed(keys)])
+        return self.take(order[:n])
+
+    def to_frame(self):
+        """DataFrame for st.dataframe, with names turned into TradingView links."""
+        df = pd.DataFrame(self.columns, columns=[name for name, _ in self.schema])
+        df['Name'] = np.char.add(TRADINGVIEW_URL, self.columns['Name'].astype(str))
+        return df
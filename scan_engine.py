@@ -0,0 +1,358 @@
+import asyncio
+import contextlib
+import datetime
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from async_client import DEFAULT_CONCURRENCY, AsyncBroker, get_bars_async
+from bar_store import get_bars, load_bars
+from indicator_state import load_states, save_states
+from metrics import METRICS
+from nse_calendar import last_completed_session
+from panel import build_panel, screen_indicators
+from pipeline import run_pipeline
+from results import CHANGE_COLUMNS, SIGNAL_COLUMNS
+from stock_analysis import (
+    check_gainer, check_loser, find_buy_signal,
+    screen_gainers, screen_losers, screen_buy_signals,
+)
+
+
+class Strategy:
+    """A screening rule evaluated against one token's daily bars.
+
+    `evaluate(instrument, df)` checks a single token and returns a row dict or
+    None. The optional `screen(panel, indicators)` does the same for the whole
+    universe at once and returns the list of rows. `columns` is the
+    ((name, dtype), ...) schema of those rows, used to display them.
+    """
+
+    def __init__(self, name, evaluate, lookback_days, screen=None, columns=CHANGE_COLUMNS):
+        self.name = name
+        self.evaluate = evaluate
+        self.lookback_days = lookback_days
+        self.screen = screen
+        self.columns = columns
+
+
+STRATEGIES = {}
+
+
+def register_strategy(name, lookback_days, screen=None, columns=CHANGE_COLUMNS):
+    """Decorator registering `evaluate(instrument, df)` as a named strategy."""
+    def decorator(evaluate):
+        STRATEGIES[name] = Strategy(name, evaluate, lookback_days, screen, columns)
+        return evaluate
+    return decorator
+
+
+register_strategy("3-5% Gainers", lookback_days=5, screen=screen_gainers)(check_gainer)
+register_strategy("3-5% Losers", lookback_days=5, screen=screen_losers)(check_loser)
+register_strategy("EMA, RSI & Support Zone", lookback_days=730, screen=screen_buy_signals,
+                  columns=SIGNAL_COLUMNS)(find_buy_signal)
+
+
+# The persisted EMA/RSI state follows the window of the strategy that reads
+# it; scans with a shorter lookback compute the indicators from their panel.
+STATE_DAYS = STRATEGIES["EMA, RSI & Support Zone"].lookback_days
+
+# Frames fetched since the last NSE close, keyed by token. Each entry is
+# (session, days, df), where session is the last completed session when the
+# frame was fetched, so frames fetched before a close are not reused after
+# it; a longer request replaces a shorter one.
+_session_frames = {}
+_session_lock = threading.Lock()
+_states_lock = threading.Lock()
+
+# Below this many tokens, process-pool startup costs more than it saves
+PIPELINE_MIN_TOKENS = 500
+
+
+def _cached_frame(token, days):
+    with _session_lock:
+        cached = _session_frames.get(token)
+    if cached and cached[0] == last_completed_session() and cached[1] >= days:
+        return cached[2]
+    return None
+
+
+def _cache_frame(token, days, df):
+    with _session_lock:
+        _session_frames[token] = (last_completed_session(), days, df)
+
+
+def get_session_frame(alice, instrument, days):
+    """Return at least `days` of bars for an instrument, fetching at most once per session."""
+    df = _cached_frame(instrument.token, days)
+    if df is None:
+        df = get_bars(alice, instrument, days)
+        _cache_frame(instrument.token, days, df)
+    return df
+
+
+def has_session_frame(token, days):
+    """True if bars for the token were fetched during this session and are not empty."""
+    df = _cached_frame(token, days)
+    return df is not None and not df.empty
+
+
+def clear_session_frames(tokens=None):
+    """Drop the frames cached for this session, or only those of `tokens`."""
+    with _session_lock:
+        if tokens is None:
+            _session_frames.clear()
+        for token in tokens or ():
+            _session_frames.pop(token, None)
+
+
+def _window(df, days):
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    return df[df['datetime'] >= since]
+
+
+def scan_instrument(alice, instrument, strategies):
+    """Fetch one token's history once and evaluate every strategy against it."""
+    df = get_session_frame(alice, instrument, max(s.lookback_days for s in strategies))
+    return {s.name: s.evaluate(instrument, _window(df, s.lookback_days)) for s in strategies}
+
+
+async def _fetch_frame(broker, instrument, days):
+    df = _cached_frame(instrument.token, days)
+    if df is None:
+        df = await get_bars_async(broker, instrument, days)
+        _cache_frame(instrument.token, days, df)
+    return instrument, df
+
+
+async def fetch_frames_async(broker, instruments, days):
+    """Fetch `days` of bars for every instrument through a rate-limited AsyncBroker.
+
+    Returns [(instrument, df), ...] for the instruments that could be fetched.
+    """
+    frames = []
+    results = await asyncio.gather(*(_fetch_frame(broker, instrument, days) for instrument in instruments),
+                                   return_exceptions=True)
+    for instrument, result in zip(instruments, results):
+        if isinstance(result, Exception):
+            METRICS.exception(result)
+            print(f"Error fetching token {instrument.token}: {result}")
+        else:
+            frames.append(result)
+    return frames
+
+
+def fetch_frames(alice, instruments, days, max_workers=DEFAULT_CONCURRENCY):
+    """Blocking wrapper around `fetch_frames_async` for a pya3 session."""
+    broker = AsyncBroker(alice, max_concurrency=max_workers)
+    try:
+        return asyncio.run(fetch_frames_async(broker, list(instruments), days))
+    finally:
+        broker.close()
+
+
+def screen_frames(frames, strategies, states=None):
+    """Evaluate strategies over fetched frames on a single packed panel.
+
+    `states` (an IndicatorStates) makes the EMA/RSI computation incremental;
+    it is advanced in place and left for the caller to persist.
+    """
+    panel = build_panel(frames)
+    # Computed for the whole panel at once, so timed per scan rather than per token
+    with METRICS.timer('indicators'):
+        indicators = screen_indicators(panel, states)
+    results = {}
+    for s in strategies:
+        if s.screen is not None:
+            results[s.name] = s.screen(panel, indicators)
+        else:
+            rows = (s.evaluate(instrument, _window(df, s.lookback_days)) for instrument, df in frames)
+            results[s.name] = [row for row in rows if row is not None]
+    return results
+
+
+@contextlib.contextmanager
+def _indicator_states(days, tokens):
+    """The persisted indicator states for a scan of `days`, saved afterwards; None if it does not use them.
+
+    The scan advances its own copy, so concurrent scans do not wait for each
+    other's fetching; only its tokens' rows are merged back into the file.
+    """
+    if days != STATE_DAYS:
+        yield None
+        return
+    states = load_states()
+    yield states
+    with _states_lock:
+        latest = load_states()
+        latest.update(states, tokens)
+        save_states(latest)
+
+
+def _verify_states(states, tokens, days):
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    for token, name, incremental, recomputed in states.verify(load_bars, since, tokens):
+        print(f"Indicator state mismatch for token {token}: {name} "
+              f"incremental={incremental} recomputed={recomputed}")
+
+
+def scan_tokens(alice, instruments, strategy_names=None, max_workers=DEFAULT_CONCURRENCY, use_panel=True,
+                verify_states=False, processes=None):
+    """Evaluate the named strategies (default: all) over instruments in one pass.
+
+    Returns a dict mapping each strategy name to its list of result rows. By
+    default all histories are fetched first and screened on one panel, with
+    EMA/RSI advanced incrementally from the persisted indicator state when the
+    scan covers STATE_DAYS; `verify_states=True` also checks that state
+    against a full recompute.
+
+    Universes of PIPELINE_MIN_TOKENS or more on a multi-core machine are
+    screened in batches on a process pool while fetching continues (see
+    pipeline.py); `processes` sets the pool size, 0 keeps everything in this
+    process. With `use_panel=False` every token is evaluated on its own
+    DataFrame, which is slower but easier to debug.
+    """
+    strategies = [STRATEGIES[name] for name in (strategy_names or STRATEGIES)]
+    instruments = list(instruments)
+    days = max(s.lookback_days for s in strategies)
+
+    if processes is None:
+        processes = os.cpu_count() if len(instruments) >= PIPELINE_MIN_TOKENS else 0
+    if use_panel and processes and processes > 1:
+        with _indicator_states(days, [instrument.token for instrument in instruments]) as states:
+            results = run_pipeline(alice, instruments, strategies, days, states, processes, max_workers)
+        if verify_states and states is not None:
+            _verify_states(states, [instrument.token for instrument in instruments], days)
+        return results
+
+    if use_panel:
+        frames = fetch_frames(alice, instruments, days, max_workers)
+        with _indicator_states(days, [instrument.token for instrument, _ in frames]) as states:
+            results = screen_frames(frames, strategies, states)
+        if verify_states and states is not None:
+            _verify_states(states, [instrument.token for instrument, _ in frames], days)
+        return results
+
+    results = {s.name: [] for s in strategies}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(scan_instrument, alice, instrument, strategies): instrument.token
+                   for instrument in instruments}
+        for future in as_completed(futures):
+            try:
+                rows = future.result()
+            except Exception as e:
+                METRICS.exception(e)
+                print(f"Error scanning token {futures[future]}: {e}")
+                continue
+            for name, row in rows.items():
+                if row is not None:
+                    results[name].append(row)
+    return results
+
+
+def scan_outcomes(alice, instruments, strategy_names=None, **kwargs):
+    """Scan strategies (default: all) and key their outcome by token.
+
+    Returns ({strategy: {token: row or None}}, failed_tokens). Each strategy
+    maps only the tokens whose bars could be fetched; failed_tokens are the
+    ones missing from at least one strategy.
+    """
+    instruments = list(instruments)
+    scanned = scan_tokens(alice, instruments, strategy_names, **kwargs)
+    outcomes, failed = {}, set()
+    for name, found in scanned.items():
+        days = STRATEGIES[name].lookback_days
+        rows = {instrument.token: None for instrument in instruments if has_session_frame(instrument.token, days)}
+        rows.update((row['Token'], row) for row in found if row['Token'] in rows)
+        failed.update(instrument.token for instrument in instruments if instrument.token not in rows)
+        outcomes[name] = rows
+    return outcomes, [instrument.token for instrument in instruments if instrument.token in failed]
+
+
+def scan_rows(alice, instruments, strategy_name, **kwargs):
+    """Scan one strategy and key its outcome by token.
+
+    Returns ({token: row or None}, failed_tokens), the shape result_cache
+    expects from its compute callback.
+    """
+    instruments = list(instruments)
+    outcomes, failed = scan_outcomes(alice, instruments, [strategy_name], **kwargs)
+    rows = {instrument.token: None for instrument in instruments}
+    rows.update(outcomes[strategy_name])
+    return rows, failed
+
+
+class ScanProgress:
+    """Running totals of a streaming scan."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.errors = 0
+        self.hits = 0
+        self.token = None  # token of the most recently completed instrument
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self):
+        """Tokens completed per second."""
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+
+def iter_scan(alice, instruments, strategy_names=None, max_workers=DEFAULT_CONCURRENCY):
+    """Scan tokens and yield `(progress, rows)` as soon as each token completes.
+
+    `rows` maps strategy name to the row found for that token (or None), and is
+    None when the token failed. Tokens are evaluated one by one on their own
+    DataFrame, trading total scan time for time-to-first-result.
+    """
+    instruments = list(instruments)
+    strategies = [STRATEGIES[name] for name in (strategy_names or STRATEGIES)]
+    days = max(s.lookback_days for s in strategies)
+    completed = queue.Queue()
+    stop = threading.Event()
+
+    async def scan(broker, instrument):
+        try:
+            _, df = await _fetch_frame(broker, instrument, days)
+            rows = {s.name: s.evaluate(instrument, _window(df, s.lookback_days)) for s in strategies}
+            completed.put((instrument, rows))
+        except Exception as e:
+            METRICS.exception(e)
+            print(f"Error scanning token {instrument.token}: {e}")
+            completed.put((instrument, None))
+
+    async def produce():
+        broker = AsyncBroker(alice, max_concurrency=max_workers)
+        try:
+            pending = [asyncio.ensure_future(scan(broker, instrument)) for instrument in instruments]
+            while pending and not stop.is_set():
+                _, pending = await asyncio.wait(pending, timeout=0.5)
+            for task in pending:
+                task.cancel()
+        finally:
+            broker.close()
+
+    producer = threading.Thread(target=asyncio.run, args=(produce(),), daemon=True)
+    producer.start()
+
+    progress = ScanProgress(len(instruments))
+    try:
+        while progress.done < progress.total:
+            instrument, rows = completed.get()
+            progress.done += 1
+            progress.token = instrument.token
+            if rows is None:
+                progress.errors += 1
+            else:
+                progress.hits += sum(row is not None for row in rows.values())
+            yield progress, rows
+    finally:
+        # The consumer may stop early; let the producer wind down
+        stop.set()
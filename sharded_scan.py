@@ -0,0 +1,509 @@
+"""Scan a large universe with several workers, each on its own broker session.
+
+The coordinator splits the tokens into shards and queues them in one SQLite
+file. Workers lease one shard at a time, scan it and write the rows back.
+A worker renews its lease while it scans. If it dies or stalls, its shard
+goes to the next worker that asks. Tokens a worker could not fetch are
+queued again as a new shard, preferably for a different worker, up to
+MAX_ATTEMPTS times. Rows are stored once per (token, strategy), so a shard
+that ran twice still merges into one row per token.
+
+Every worker logs in with the same credentials, so they share one account's
+rate limit. The n local workers split it evenly: each runs with BROKER_RATE
+(requests per second, see async_client) set to the account's rate / n.
+Workers on other hosts using the same account must be given their part too,
+e.g. BROKER_RATE=2.5 when four workers share the default 10.
+
+The queue file runs in SQLite's WAL mode, which needs every process on the
+same host: do not put it on a network filesystem. Workers on other hosts
+talk to the coordinator's QueueServer over HTTP instead (on a trusted
+network; it has no authentication):
+
+    python batch_screener.py --workers 4                           # coordinator + 4 local workers
+    python batch_screener.py --workers 2 --serve-queue 0.0.0.0:8765
+    python sharded_scan.py --queue http://coordinator:8765/ --wait  # on another host
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from async_client import DEFAULT_RATE
+from indicator_state import STATE_FILE
+from instruments import Instrument
+from metrics import METRICS
+from result_cache import _to_json
+
+QUEUE_FILE = os.environ.get("SHARD_QUEUE_FILE", os.path.join("data", "shards.sqlite"))
+
+SHARD_SIZE = 250
+# A worker renews its lease every LEASE_SECONDS / 4; one that misses several renewals is presumed dead
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 1.0
+# Finished jobs are deleted from the queue after this long
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job TEXT PRIMARY KEY,
+    strategies TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shards (
+    job TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    instruments TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    last_owner TEXT,
+    expires REAL,
+    error TEXT,
+    metrics TEXT,
+    PRIMARY KEY (job, shard)
+);
+CREATE TABLE IF NOT EXISTS results (
+    job TEXT NOT NULL,
+    token INTEGER NOT NULL,
+    strategy TEXT NOT NULL,
+    row TEXT,
+    PRIMARY KEY (job, token, strategy)
+);
+"""
+
+
+class Shard:
+    """A leased shard: the instruments to scan for a job's strategies."""
+
+    def __init__(self, job, shard, strategies, instruments):
+        self.job = job
+        self.shard = shard
+        self.strategies = strategies
+        self.instruments = instruments
+
+    def to_dict(self):
+        return {'job': self.job, 'shard': self.shard, 'strategies': self.strategies,
+                'instruments': [list(instrument) for instrument in self.instruments]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['job'], data['shard'], data['strategies'],
+                   [Instrument(*fields) for fields in data['instruments']])
+
+
+class ShardQueue:
+    """Jobs, their shards and the rows scanned so far, in one SQLite file.
+
+    A shard is 'pending', 'leased' to a worker until `expires`, 'done', or
+    'failed' once MAX_ATTEMPTS leases did not complete it.
+    """
+
+    def __init__(self, path=QUEUE_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self, immediate=False):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                if immediate:
+                    # Take the write lock up front, so read-then-write is atomic across workers
+                    db.execute("BEGIN IMMEDIATE")
+                yield db
+        finally:
+            db.close()
+
+    def submit(self, instruments, strategies, shard_size=SHARD_SIZE):
+        """Queue a job scanning `strategies` over instruments; returns its id."""
+        job = uuid.uuid4().hex
+        instruments = [list(instrument) for instrument in instruments]
+        now = time.time()
+        with self._connect() as db:
+            self._purge(db, now)
+            db.execute("INSERT INTO jobs VALUES (?, ?, ?)", (job, json.dumps(list(strategies)), now))
+            db.executemany("INSERT INTO shards (job, shard, instruments, status) VALUES (?, ?, ?, 'pending')",
+                           [(job, i, json.dumps(instruments[start:start + shard_size], default=_to_json))
+                            for i, start in enumerate(range(0, len(instruments), shard_size))])
+        return job
+
+    def _purge(self, db, now):
+        old = [job for job, in db.execute("SELECT job FROM jobs WHERE created < ?",
+                                          (now - JOB_RETENTION_SECONDS,))]
+        for table in ('results', 'shards', 'jobs'):
+            db.executemany(f"DELETE FROM {table} WHERE job = ?", [(job,) for job in old])
+
+    def claim(self, owner, job=None):
+        """Lease the next pending or expired shard, of `job` or any job; None if there is none.
+
+        Shards this owner already tried come last, so a retry goes to another
+        worker when there is one.
+        """
+        now = time.time()
+        with self._connect(immediate=True) as db:
+            db.execute("UPDATE shards SET status = 'failed', owner = NULL, error = 'lease expired' "
+                       "WHERE status = 'leased' AND expires < ? AND attempts >= ?", (now, MAX_ATTEMPTS))
+            query = ("SELECT shards.job, shard, strategies, instruments FROM shards JOIN jobs USING (job) "
+                     "WHERE (status = 'pending' OR (status = 'leased' AND expires < ?))")
+            args = [now]
+            if job is not None:
+                query += " AND shards.job = ?"
+                args.append(job)
+            query += " ORDER BY last_owner IS ?, created, shard LIMIT 1"
+            found = db.execute(query, (*args, owner)).fetchone()
+            if found is None:
+                return None
+            job, shard, strategies, instruments = found
+            db.execute("UPDATE shards SET status = 'leased', owner = ?, last_owner = ?, expires = ?, "
+                       "attempts = attempts + 1 WHERE job = ? AND shard = ?",
+                       (owner, owner, now + LEASE_SECONDS, job, shard))
+        return Shard(job, shard, json.loads(strategies),
+                     [Instrument(*fields) for fields in json.loads(instruments)])
+
+    def renew(self, shard, owner):
+        """Extend a lease; False if the shard is no longer leased to `owner`."""
+        with self._connect() as db:
+            cursor = db.execute("UPDATE shards SET expires = ? WHERE job = ? AND shard = ? "
+                                "AND status = 'leased' AND owner = ?",
+                                (time.time() + LEASE_SECONDS, shard.job, shard.shard, owner))
+            return cursor.rowcount == 1
+
+    def complete(self, shard, owner, outcomes, failed, metrics=None):
+        """Save a scanned shard's {strategy: {token: row or None}} and queue its failed tokens again.
+
+        Rows are kept even when the lease was lost meanwhile; another worker
+        scanning the same tokens overwrites them with the same rows.
+        """
+        with self._connect(immediate=True) as db:
+            db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                           [(shard.job, int(token), strategy,
+                             None if row is None else json.dumps(row, default=_to_json))
+                            for strategy, rows in outcomes.items() for token, row in rows.items()])
+            owned = db.execute("UPDATE shards SET status = 'done', owner = NULL, expires = NULL, metrics = ? "
+                               "WHERE job = ? AND shard = ? AND status = 'leased' AND owner = ?",
+                               (json.dumps(metrics) if metrics else None, shard.job, shard.shard, owner)).rowcount
+            # Whoever holds the lease now requeues its own failures
+            if not owned or not failed:
+                return
+            attempts, = db.execute("SELECT attempts FROM shards WHERE job = ? AND shard = ?",
+                                   (shard.job, shard.shard)).fetchone()
+            if attempts >= MAX_ATTEMPTS:
+                return
+            failed = set(failed)
+            retry = [list(instrument) for instrument in shard.instruments if instrument.token in failed]
+            next_shard, = db.execute("SELECT MAX(shard) + 1 FROM shards WHERE job = ?", (shard.job,)).fetchone()
+            db.execute("INSERT INTO shards (job, shard, instruments, status, attempts, last_owner, error) "
+                       "VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+                       (shard.job, next_shard, json.dumps(retry, default=_to_json), attempts, owner,
+                        f"{len(retry)} tokens failed in shard {shard.shard}"))
+
+    def fail(self, shard, owner, error):
+        """Give a shard back after an error; it fails for good after MAX_ATTEMPTS."""
+        with self._connect() as db:
+            db.execute("UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "owner = NULL, expires = NULL, error = ? "
+                       "WHERE job = ? AND shard = ? AND status = 'leased' AND owner = ?",
+                       (MAX_ATTEMPTS, str(error), shard.job, shard.shard, owner))
+
+    def status(self, job=None):
+        """Number of shards per status, of `job` or of every job."""
+        query = "SELECT status, COUNT(*) FROM shards"
+        args = ()
+        if job is not None:
+            query += " WHERE job = ?"
+            args = (job,)
+        with self._connect() as db:
+            return dict(db.execute(query + " GROUP BY status", args).fetchall())
+
+    def results(self, job):
+        """The merged {strategy: {token: row or None}} of a job, one row per token."""
+        outcomes = {strategy: {} for strategy in self._strategies(job)}
+        with self._connect() as db:
+            for token, strategy, row in db.execute(
+                    "SELECT token, strategy, row FROM results WHERE job = ?", (job,)):
+                outcomes[strategy][token] = json.loads(row) if row is not None else None
+        return outcomes
+
+    def metrics(self, job):
+        """The METRICS snapshots of the job's completed shards."""
+        with self._connect() as db:
+            return [json.loads(metrics) for metrics, in db.execute(
+                "SELECT metrics FROM shards WHERE job = ? AND metrics IS NOT NULL", (job,))]
+
+    def _strategies(self, job):
+        with self._connect() as db:
+            strategies, = db.execute("SELECT strategies FROM jobs WHERE job = ?", (job,)).fetchone()
+        return json.loads(strategies)
+
+
+class QueueServer:
+    """Serves a ShardQueue's worker calls over HTTP, for workers on other hosts.
+
+    Each call is a POST to /<method> with the method's arguments as a JSON
+    object; the reply is its JSON result.
+    """
+
+    def __init__(self, queue, host='0.0.0.0', port=0):
+        self.queue = queue
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        if host in ('0.0.0.0', ''):
+            host = socket.gethostname()
+        return f"http://{host}:{port}/"
+
+    def _call(self, method, body):
+        if method == 'claim':
+            shard = self.queue.claim(body['owner'], body.get('job'))
+            return None if shard is None else shard.to_dict()
+        if method == 'renew':
+            return self.queue.renew(Shard.from_dict(body['shard']), body['owner'])
+        if method == 'complete':
+            self.queue.complete(Shard.from_dict(body['shard']), body['owner'], body['outcomes'],
+                                body['failed'], body.get('metrics'))
+            return True
+        if method == 'fail':
+            self.queue.fail(Shard.from_dict(body['shard']), body['owner'], body['error'])
+            return True
+        if method == 'status':
+            return self.queue.status(body.get('job'))
+        raise KeyError(method)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                try:
+                    status, payload = 200, server._call(self.path.strip('/'), body)
+                except KeyError as e:
+                    status, payload = 404, {'error': f"Unknown call {e}"}
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+                data = json.dumps(payload, default=_to_json).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class RemoteShardQueue:
+    """The worker side of ShardQueue, talking to a coordinator's QueueServer."""
+
+    def __init__(self, url):
+        import requests
+
+        self.url = url.rstrip('/') + '/'
+        self._session = requests.Session()
+
+    def _call(self, method, **body):
+        response = self._session.post(self.url + method, data=json.dumps(body, default=_to_json),
+                                      headers={'Content-Type': 'application/json'}, timeout=60)
+        if response.status_code != 200:
+            raise Exception(f"Shard queue call {method} failed: {response.text}")
+        return response.json()
+
+    def claim(self, owner, job=None):
+        data = self._call('claim', owner=owner, job=job)
+        return None if data is None else Shard.from_dict(data)
+
+    def renew(self, shard, owner):
+        return self._call('renew', shard=shard.to_dict(), owner=owner)
+
+    def complete(self, shard, owner, outcomes, failed, metrics=None):
+        # JSON object keys are strings; ShardQueue.complete turns tokens back into ints
+        self._call('complete', shard=shard.to_dict(), owner=owner, outcomes=outcomes,
+                   failed=[int(token) for token in failed], metrics=metrics)
+
+    def fail(self, shard, owner, error):
+        self._call('fail', shard=shard.to_dict(), owner=owner, error=str(error))
+
+    def status(self, job=None):
+        return self._call('status', job=job)
+
+
+def open_queue(location):
+    """A RemoteShardQueue for an http(s) URL, else the ShardQueue in that file."""
+    if location.startswith(('http://', 'https://')):
+        return RemoteShardQueue(location)
+    return ShardQueue(location)
+
+
+def _renew_lease(queue, shard, owner, stop):
+    while not stop.wait(LEASE_SECONDS / 4):
+        if not queue.renew(shard, owner):
+            print(f"Lost the lease on shard {shard.shard} of job {shard.job}")
+            return
+
+
+def run_worker(alice, location=QUEUE_FILE, job=None, processes=None, owner=None, wait=False):
+    """Scan shards until no job has work left; returns the number of tokens scanned.
+
+    `location` is the queue file or a QueueServer URL. With `job`, only that
+    job's shards are taken. With `wait`, keep polling for new jobs instead
+    of returning.
+    """
+    from scan_engine import clear_session_frames, scan_outcomes
+
+    queue = open_queue(location)
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    scanned = 0
+    while True:
+        shard = queue.claim(owner, job)
+        if shard is None:
+            # Shards leased by other workers come back if those workers die
+            if wait or queue.status(job).get('leased'):
+                time.sleep(POLL_SECONDS)
+                continue
+            return scanned
+
+        stop = threading.Event()
+        threading.Thread(target=_renew_lease, args=(queue, shard, owner, stop), daemon=True).start()
+        METRICS.reset()
+        try:
+            outcomes, failed = scan_outcomes(alice, shard.instruments, shard.strategies, processes=processes)
+        except Exception as e:
+            METRICS.exception(e)
+            print(f"Error scanning shard {shard.shard} of job {shard.job}: {e}")
+            queue.fail(shard, owner, e)
+            continue
+        finally:
+            stop.set()
+            # Frames are not needed again, and a retried token must be fetched afresh
+            clear_session_frames([instrument.token for instrument in shard.instruments])
+        queue.complete(shard, owner, outcomes, failed, METRICS.snapshot())
+        scanned += len(shard.instruments)
+
+
+def start_workers(n, path, job, processes=None, args=(), env=None):
+    """Start n local worker processes for a job.
+
+    The workers log in to the same account, so they split its request rate
+    (BROKER_RATE in `env`, default DEFAULT_RATE) evenly. Each keeps its own
+    indicator state file: the state is saved whole, so workers sharing one
+    file would drop each other's updates.
+    """
+    env = dict(env or os.environ)
+    if processes is None:
+        # The workers share this machine's cores
+        processes = (os.cpu_count() or 1) // n
+    rate = float(env.get('BROKER_RATE', DEFAULT_RATE)) / n
+    command = [sys.executable, os.path.abspath(__file__), '--queue', path, '--job', job,
+               '--processes', str(processes), *args]
+    state_dir = os.path.dirname(STATE_FILE)
+    return [subprocess.Popen(command, env=dict(env, BROKER_RATE=str(rate), INDICATOR_STATE_FILE=os.path.join(
+                state_dir, f"indicator_state.worker{i}.npz"))) for i in range(n)]
+
+
+def run_sharded(instruments, strategy_names, workers=2, shard_size=SHARD_SIZE, path=QUEUE_FILE,
+                processes=None, worker_args=(), env=None, serve=None):
+    """Scan instruments on `workers` local processes (0: wait for remote ones only).
+
+    With `serve` ("host:port"), the queue is also served over HTTP for
+    workers on other hosts. Returns ({strategy: {token: row or None}},
+    metadata). Tokens missing from a strategy's rows could not be scanned.
+    The workers' METRICS are merged into this process's.
+    """
+    queue = ShardQueue(path)
+    job = queue.submit(instruments, strategy_names, shard_size)
+    server = None
+    if serve:
+        host, port = serve.rsplit(':', 1)
+        server = QueueServer(queue, host, int(port)).start()
+        print(f"Serving the shard queue at {server.url}; start more workers with\n"
+              f"    python sharded_scan.py --queue {server.url} --job {job}")
+    procs = start_workers(workers, path, job, processes, worker_args, env) if workers else []
+    last = None
+    try:
+        while True:
+            status = queue.status(job)
+            if not status.get('pending') and not status.get('leased'):
+                break
+            if status != last:
+                print("Shards: " + ", ".join(f"{n} {state}" for state, n in sorted(status.items())))
+                last = status
+            if procs and all(proc.poll() is not None for proc in procs):
+                print("All workers exited with shards left; the rest counts as failed.")
+                break
+            time.sleep(POLL_SECONDS)
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+            proc.wait()
+        if server is not None:
+            server.stop()
+
+    for snapshot in queue.metrics(job):
+        METRICS.merge(snapshot)
+    status = queue.status(job)
+    metadata = {'job': job, 'workers': workers, 'shards': sum(status.values()), 'shard_status': status}
+    return queue.results(job), metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan shards from a sharded_scan queue.")
+    parser.add_argument('--queue', default=QUEUE_FILE,
+                        help="queue file on this host, or the URL of the coordinator's queue server")
+    parser.add_argument('--job', help="only work on this job")
+    parser.add_argument('--processes', type=int, default=None, help="compute pool size, 0 for in-process")
+    parser.add_argument('--wait', action='store_true', help="keep polling for new jobs")
+    parser.add_argument('--user-id', default=os.environ.get("ALICEBLUE_USER_ID"),
+                        help="AliceBlue user id (default: $ALICEBLUE_USER_ID or credentials saved by the app)")
+    parser.add_argument('--api-key', default=os.environ.get("ALICEBLUE_API_KEY"),
+                        help="AliceBlue API key (default: $ALICEBLUE_API_KEY)")
+    parser.add_argument('--fake-broker', metavar='URL',
+                        help="for testing: fetch from a fake_broker.FakeBrokerServer at URL instead")
+    args = parser.parse_args()
+
+    try:
+        if args.fake_broker:
+            from fake_broker import FakeAlice
+            alice = FakeAlice(args.fake_broker)
+        else:
+            from batch_screener import connect
+            alice = connect(args.user_id, args.api_key)
+    except Exception as e:
+        print(f"Failed to initialize AliceBlue API: {e}")
+        return 1
+
+    started = time.perf_counter()
+    scanned = run_worker(alice, args.queue, args.job, args.processes, wait=args.wait)
+    print(f"Worker {socket.gethostname()}:{os.getpid()} scanned {scanned} tokens "
+          f"in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Versioned on-disk snapshots of complete screening runs.
+
+Each run of batch_screener.py writes one directory,
+
+    data/snapshots/<session>/<run id>/
+        manifest.json
+        metrics.json                       stage latencies and error counters
+        <stock list>__<strategy>.parquet   (or .json)
+
+and only then points `latest.json` at it, so readers never see a half
+written run. The manifest records when the run happened, which NSE session
+it covers and how long each stage took.
+"""
+import json
+import os
+import re
+import shutil
+
+import pandas as pd
+
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join("data", "snapshots"))
+LATEST_FILE = "latest.json"
+FORMATS = ("parquet", "json")
+
+
+def _slug(name):
+    return re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-').lower()
+
+
+def result_file(list_name, strategy, fmt):
+    return f"{_slug(list_name)}__{_slug(strategy)}.{fmt}"
+
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+def write_snapshot(session, run_id, results, fmt="parquet", root=SNAPSHOT_DIR):
+    """Write {list name: {strategy: rows}} into a new snapshot directory.
+
+    Returns (run directory, files), where files is the manifest's 'results'
+    entry. The snapshot is not visible until publish_snapshot is called.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown snapshot format {fmt!r}, expected one of {FORMATS}")
+    run_dir = os.path.join(root, str(session), run_id)
+    os.makedirs(run_dir, exist_ok=True)
+
+    files = {}
+    for list_name, by_strategy in results.items():
+        for strategy, rows in by_strategy.items():
+            name = result_file(list_name, strategy, fmt)
+            df = pd.DataFrame(rows)
+            if fmt == "parquet":
+                df.to_parquet(os.path.join(run_dir, name), index=False)
+            else:
+                df.to_json(os.path.join(run_dir, name), orient='records')
+            files.setdefault(list_name, {})[strategy] = {'file': name, 'rows': len(rows)}
+
+    return run_dir, files
+
+
+def publish_snapshot(run_dir, manifest, root=SNAPSHOT_DIR):
+    """Write the manifest of a finished snapshot and mark it as the latest."""
+    _write_json(os.path.join(run_dir, "manifest.json"), manifest)
+    _write_json(os.path.join(root, LATEST_FILE), {'path': os.path.relpath(run_dir, root)})
+
+
+def latest_snapshot(root=SNAPSHOT_DIR):
+    """Return (run directory, manifest) of the latest snapshot, or (None, None)."""
+    try:
+        with open(os.path.join(root, LATEST_FILE)) as f:
+            run_dir = os.path.join(root, json.load(f)['path'])
+        with open(os.path.join(run_dir, "manifest.json")) as f:
+            return run_dir, json.load(f)
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def load_results(list_name, strategy, session=None, root=SNAPSHOT_DIR):
+    """Results of one stock list and strategy from the latest snapshot.
+
+    Returns (DataFrame, manifest), or (None, None) when there is no snapshot for it
+    or, if `session` is given, when the latest snapshot covers another session.
+    """
+    run_dir, manifest = latest_snapshot(root)
+    if manifest is None or (session is not None and manifest['session'] != str(session)):
+        return None, None
+    entry = manifest['results'].get(list_name, {}).get(strategy)
+    if entry is None:
+        return None, None
+
+    path = os.path.join(run_dir, entry['file'])
+    df = pd.read_parquet(path) if manifest['format'] == "parquet" else pd.read_json(path, orient='records')
+    return df, manifest
+
+
+def prune_snapshots(keep, root=SNAPSHOT_DIR):
+    """Delete all but the `keep` most recent runs (never the latest one)."""
+    latest, _ = latest_snapshot(root)
+    runs = []
+    for session in os.listdir(root) if os.path.isdir(root) else []:
+        session_dir = os.path.join(root, session)
+        if os.path.isdir(session_dir):
+            runs.extend(os.path.join(session_dir, run) for run in os.listdir(session_dir))
+    runs.sort(key=lambda path: os.path.relpath(path, root))
+    for run_dir in runs[:-keep] if keep > 0 else []:
+        if latest is None or os.path.abspath(run_dir) != os.path.abspath(latest):
+            shutil.rmtree(run_dir, ignore_errors=True)
+    for session in os.listdir(root) if os.path.isdir(root) else []:
+        session_dir = os.path.join(root, session)
+        if os.path.isdir(session_dir) and not os.listdir(session_dir):
+            os.rmdir(session_dir)
@@ -1,66 +1,74 @@
-import pandas as pd
+from collections import namedtuple
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-from scipy.signal import argrelextrema
+from bar_store import get_bars
+from metrics import METRICS
+from support import find_support_cluster
+
+# Thresholds of the screening strategies. Gainers use change_low..change_high,
+# losers the same band below zero; the rest belong to the support-zone rules.
+StrategyParams = namedtuple('StrategyParams', [
+    'change_low', 'change_high', 'rsi_max', 'band_low', 'band_high', 'lookback',
+    'volume_ratio', 'window_pct', 'min_window', 'tolerance_std', 'min_bars',
+])
+DEFAULT_PARAMS = StrategyParams(change_low=3, change_high=5, rsi_max=65, band_low=1.05, band_high=1.20,
+                                lookback=126, volume_ratio=0.8, window_pct=0.05, min_window=5,
+                                tolerance_std=0.3, min_bars=100)
+
+
+def support_options(params):
+    """Keyword arguments of `find_support_cluster` for a StrategyParams."""
+    return dict(lookback=params.lookback, window_pct=params.window_pct, min_window=params.min_window,
+                band=(params.band_low, params.band_high), volume_ratio=params.volume_ratio,
+                tolerance_std=params.tolerance_std)
+
+
+def check_change(instrument, df, low, high):
+    """Return a row if the last close changed between low% and high% over the prior close."""
+    if len(df) < 2:
+        return None  # Not enough data
+
+    yesterday_close = df['close'].iloc[-1]
+    day_before_close = df['close'].iloc[-2]
+    pct_change = ((yesterday_close - day_before_close) / day_before_close) * 100
+
+    if low <= pct_change <= high:
+        return {
+            'Name': instrument.name,
+            'Token': instrument.token,
+            'Close': yesterday_close,
+            'Change (%)': pct_change
+        }
+    return None
+
+
+def check_gainer(instrument, df, params=DEFAULT_PARAMS):
+    """Check if the stock gained 3-5%."""
+    return check_change(instrument, df, params.change_low, params.change_high)
 
 
-def fetch_stock_data_up(alice, token):
+def check_loser(instrument, df, params=DEFAULT_PARAMS):
+    """Check if the stock lost 3-5%."""
+    return check_change(instrument, df, -params.change_high, -params.change_low)
+
+
+def fetch_stock_data_up(alice, instrument):
     """Fetch historical data and check if the stock gained 3-5%."""
     try:
-        instrument = alice.get_instrument_by_token('NSE', token)
-        to_datetime = datetime.now()
-        from_datetime = to_datetime - timedelta(days=5)
-        interval = "D"
-        historical_data = alice.get_historical(instrument, from_datetime, to_datetime, interval)
-        df = pd.DataFrame(historical_data)
-
-        if len(df) < 2:
-            return None  # Not enough data
-
-        yesterday_close = df['close'].iloc[-1]
-        day_before_close = df['close'].iloc[-2]
-        pct_change = ((yesterday_close - day_before_close) / day_before_close) * 100
-
-        if 3 <= pct_change <= 5:
-            return {
-                'Name': instrument.name,
-                'Token': token,
-                'Close': yesterday_close,
-                'Change (%)': pct_change
-            }
+        return check_gainer(instrument, get_bars(alice, instrument, days=5))
     except Exception as e:
-        print(f"Error processing token {token}: {e}")
+        METRICS.exception(e)
+        print(f"Error processing token {instrument.token}: {e}")
     return None
 
 
-def fetch_stock_data_down(alice, token):
+def fetch_stock_data_down(alice, instrument):
     """Fetch historical data and check if the stock lost 3-5%."""
     try:
-        instrument = alice.get_instrument_by_token('NSE', token)
-        to_datetime = datetime.now()
-        from_datetime = to_datetime - timedelta(days=5)
-        interval = "D"
-        historical_data = alice.get_historical(instrument, from_datetime, to_datetime, interval)
-        df = pd.DataFrame(historical_data)
-
-        if len(df) < 2:
-            return None  # Not enough data
-
-        yesterday_close = df['close'].iloc[-1]
-        day_before_close = df['close'].iloc[-2]
-        pct_change = ((yesterday_close - day_before_close) / day_before_close) * 100
-
-        if -5 <= pct_change <= -3:
-            return {
-                'Name': instrument.name,
-                'Token': token,
-                'Close': yesterday_close,
-                'Change (%)': pct_change
-            }
+        return check_loser(instrument, get_bars(alice, instrument, days=5))
     except Exception as e:
-        print(f"Error processing token {token}: {e}")
+        METRICS.exception(e)
+        print(f"Error processing token {instrument.token}: {e}")
     return None
 
 
@@ -74,98 +82,101 @@ def compute_rsi(prices, window=14):
     return 100 - (100 / (1 + rs)).iloc[-1]
 
 
-def analyze_stock(alice, token):
-    """Analyze stock based on EMA, RSI, and local support zones."""
-    try:
-        instrument = alice.get_instrument_by_token('NSE', token)
-        from_date = datetime.now() - timedelta(days=730)
-        historical_data = alice.get_historical(instrument, from_date, datetime.now(), "D")
-        df = pd.DataFrame(historical_data).dropna()
+def _buy_signal_row(instrument, close_prices, best_cluster, rsi, ema_50, ema_200):
+    current_price = close_prices[-1]
+    distance_pct = (current_price / best_cluster['price'] - 1) * 100
 
-        if len(df) < 100:
-            return None
+    return {
+        'Token': instrument.token,
+        'Name': instrument.name.split('-')[0].strip(),
+        'Price': current_price,
+        'Support': best_cluster['price'],
+        'Strength': best_cluster['count'],
+        'Distance%': distance_pct,
+        'RSI': rsi,
+        'Trend': 'Bullish' if ema_50 > ema_200 else 'Bearish'
+    }
 
-        df['50_EMA'] = df['close'].ewm(span=50).mean()
-        df['200_EMA'] = df['close'].ewm(span=200).mean()
+
+def find_buy_signal(instrument, df, params=DEFAULT_PARAMS):
+    """Check a stock's daily bars against the EMA, RSI and local support zone rules."""
+    if len(df) < params.min_bars:
+        return None
+
+    with METRICS.timer('indicators', instrument.token):
+        ema_50 = df['close'].ewm(span=50).mean().iloc[-1]
+        ema_200 = df['close'].ewm(span=200).mean().iloc[-1]
         rsi = compute_rsi(df['close'])
 
-        close_prices = df['close'].values
-        scaler = MinMaxScaler()
-        normalized_prices = scaler.fit_transform(close_prices.reshape(-1, 1)).flatten()
-
-        window_size = max(int(len(df) * 0.05), 5)
-        local_min = argrelextrema(normalized_prices, np.less_equal, order=window_size)[0]
-
-        valid_supports = []
-        for m in local_min:
-            if m < len(df) - 126:  # Older than 6 months
-                continue
-            support_price = close_prices[m]
-            current_price = close_prices[-1]
-
-            if 1.05 <= (current_price / support_price) <= 1.20:
-                if df['volume'].iloc[-1] > df['volume'].iloc[m] * 0.8:
-                    valid_supports.append({
-                        'price': support_price,
-                        'date': df.index[m],
-                        'touches': 1
-                    })
-
-        if not valid_supports:
-            return None
-
-        support_clusters = []
-        tolerance = np.std(close_prices) * 0.3
-        for sup in valid_supports:
-            found = False
-            for cluster in support_clusters:
-                if abs(sup['price'] - cluster['price']) <= tolerance:
-                    cluster['count'] += 1
-                    found = True
-                    break
-            if not found:
-                support_clusters.append({
-                    'price': sup['price'],
-                    'count': 1,
-                    'dates': [sup['date']]
-                })
-
-        if not support_clusters:
-            return None
-
-        best_cluster = max(support_clusters, key=lambda x: x['count'])
-
-        if df['50_EMA'].iloc[-1] < df['200_EMA'].iloc[-1]:
-            return None
-
-        if rsi > 65:
-            return None
-
-        current_price = close_prices[-1]
-        distance_pct = (current_price / best_cluster['price'] - 1) * 100
+    close_prices = df['close'].values
+    with METRICS.timer('support', instrument.token):
+        best_cluster = find_support_cluster(close_prices, df['volume'].values, **support_options(params))
+    if best_cluster is None:
+        return None
 
-        return {
-            'Token': token,
-            'Name': instrument.name.split('-')[0].strip(),
-            'Price': current_price,
-            'Support': best_cluster['price'],
-            'Strength': best_cluster['count'],
-            'Distance%': distance_pct,
-            'RSI': rsi,
-            'Trend': 'Bullish' if df['50_EMA'].iloc[-1] > df['200_EMA'].iloc[-1] else 'Bearish'
-        }
-    except Exception as e:
-        print(f"Error analyzing {token}: {str(e)}")
+    if ema_50 < ema_200:
+        return None
+
+    if rsi > params.rsi_max:
         return None
 
+    return _buy_signal_row(instrument, close_prices, best_cluster, rsi, ema_50, ema_200)
+
+
+def screen_change(panel, indicators, low, high, days):
+    """Panel version of `check_change` over the whole universe at once."""
+    since = np.datetime64(datetime.now() - timedelta(days=days), 'ns')
+    prev_dates = panel.dates[:, -2] if panel.dates.shape[1] >= 2 else np.full(len(panel), np.datetime64('NaT'))
+    pct = indicators['pct_change']
+    hits = np.flatnonzero((prev_dates >= since) & (pct >= low) & (pct <= high))
+    return [{
+        'Name': panel.instruments[i].name,
+        'Token': panel.instruments[i].token,
+        'Close': panel.close[i, -1],
+        'Change (%)': pct[i]
+    } for i in hits]
+
+
+def screen_gainers(panel, indicators, params=DEFAULT_PARAMS):
+    """Panel version of `check_gainer`."""
+    return screen_change(panel, indicators, params.change_low, params.change_high, days=5)
+
+
+def screen_losers(panel, indicators, params=DEFAULT_PARAMS):
+    """Panel version of `check_loser`."""
+    return screen_change(panel, indicators, -params.change_high, -params.change_low, days=5)
+
+
+def screen_buy_signals(panel, indicators, params=DEFAULT_PARAMS):
+    """Panel version of `find_buy_signal`.
 
-def analyze_all_tokens(alice, tokens):
-    """Analyze all tokens and collect buy signals."""
+    The trend and RSI filters run vectorized over the universe first, so the
+    support search only runs for the tokens that survive them.
+    """
+    rsi = indicators['rsi']
+    candidates = (panel.lengths >= params.min_bars) & indicators['trend_ok'] & ~(rsi > params.rsi_max)
     signals = []
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(analyze_stock, alice, token): token for token in tokens}
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                signals.append(result)
+    for i in np.flatnonzero(candidates):
+        close_prices, volumes = panel.row(i)
+        with METRICS.timer('support', panel.instruments[i].token):
+            best_cluster = find_support_cluster(close_prices, volumes, **support_options(params))
+        if best_cluster is not None:
+            signals.append(_buy_signal_row(panel.instruments[i], close_prices, best_cluster,
+                                           rsi[i], indicators['ema_50'][i], indicators['ema_200'][i]))
     return signals
+
+
+def analyze_stock(alice, instrument):
+    """Analyze stock based on EMA, RSI, and local support zones."""
+    try:
+        return find_buy_signal(instrument, get_bars(alice, instrument, days=730))
+    except Exception as e:
+        METRICS.exception(e)
+        print(f"Error analyzing {instrument.token}: {str(e)}")
+        return None
+
+
+def analyze_all_tokens(alice, instruments):
+    """Analyze all instruments and collect buy signals."""
+    from scan_engine import scan_tokens
+    return scan_tokens(alice, instruments, ["EMA, RSI & Support Zone"])["EMA, RSI & Support Zone"]
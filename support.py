@@ -0,0 +1,88 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def local_minima(close_prices, order, start=0):
+    """Indices >= start whose close is the minimum of the `order` bars on each side.
+
+    Matches `argrelextrema(close_prices, np.less_equal, order=order)` (windows
+    are clipped at the ends of the series) but only examines bars from
+    `start - order` onwards.
+    """
+    n = len(close_prices)
+    lo = max(start - order, 0)
+    segment = close_prices[lo:]
+    padded = np.concatenate([np.full(order, np.inf), segment, np.full(order, np.inf)])
+    window_min = sliding_window_view(padded, 2 * order + 1).min(axis=1)
+    candidates = np.arange(start - lo, n - lo)
+    return candidates[segment[candidates] <= window_min[candidates]] + lo
+
+
+def cluster_levels(prices, tolerance):
+    """Group price levels that lie within `tolerance` of a cluster's lowest level.
+
+    Sorts once and sweeps upwards, so clustering is O(n log n). Returns
+    (level, touches, member_indices) per cluster, lowest level first.
+    """
+    order = np.argsort(prices, kind='stable')
+    clusters = []
+    for i in order:
+        if clusters and prices[i] - clusters[-1][0] <= tolerance:
+            clusters[-1][1] += 1
+            clusters[-1][2].append(int(i))
+        else:
+            clusters.append([prices[i], 1, [int(i)]])
+    return clusters
+
+
+def strongest_cluster(level_prices, level_volumes, price, volume, tolerance,
+                      band=(1.05, 1.20), volume_ratio=0.8):
+    """Pick the strongest cluster of support levels for the given price and volume.
+
+    Only levels that `price` sits `band` above, on at least `volume_ratio` of
+    their volume, count. Returns (level, touches, indices into the levels), or
+    None. Cheap enough to call on every tick with a token's stored levels.
+    """
+    ratio = price / level_prices
+    valid = np.flatnonzero((ratio >= band[0]) & (ratio <= band[1]) & (volume > level_volumes * volume_ratio))
+    if len(valid) == 0:
+        return None
+
+    level, count, members = max(cluster_levels(level_prices[valid], tolerance), key=lambda c: c[1])
+    return level, count, [int(valid[i]) for i in members]
+
+
+def support_levels(close_prices, lookback=126, window_pct=0.05, min_window=5):
+    """Indices of the local minima among the last `lookback` bars that can act as supports."""
+    n = len(close_prices)
+    window_size = max(int(n * window_pct), min_window)
+    return local_minima(close_prices, window_size, start=max(n - lookback, 0))
+
+
+def find_support_cluster(close_prices, volumes, lookback=126, window_pct=0.05, min_window=5,
+                         band=(1.05, 1.20), volume_ratio=0.8, tolerance_std=0.3):
+    """Return the strongest cluster of recent local support levels, or None.
+
+    A support is a local minimum of the last `lookback` bars that the current
+    price sits `band` above, on at least `volume_ratio` of that day's volume.
+    Supports within `tolerance_std` standard deviations of the whole series are
+    clustered; the result is a dict with the cluster 'price' (its lowest
+    level), 'count' (number of touches) and 'dates' (bar indices).
+    """
+    close_prices = np.asarray(close_prices, dtype=float)
+    volumes = np.asarray(volumes, dtype=float)
+    if len(close_prices) == 0:
+        return None
+
+    minima = support_levels(close_prices, lookback, window_pct, min_window)
+    best = strongest_cluster(close_prices[minima], volumes[minima], close_prices[-1], volumes[-1],
+                             np.std(close_prices) * tolerance_std, band, volume_ratio)
+    if best is None:
+        return None
+
+    price, count, members = best
+    return {
+        'price': price,
+        'count': count,
+        'dates': sorted(int(minima[i]) for i in members),
+    }
@@ -0,0 +1,243 @@
+"""Backtest strategy parameters over the stored daily history.
+
+Evaluates every parameter set of a grid on every one of the last `--days`
+sessions of a stock list, as if the screener had run after each close, and
+reports how often the signals were followed by a gain (hit rate) and the
+mean/median forward returns:
+
+    python sweep.py --list "ALL STOCKS" --days 500 --rsi-max 60 65 70 --band-high 1.15 1.2 1.25
+
+Only bars already in the bar store are used (pass --fetch to top them up
+first). The history is loaded into one panel, and everything the grid has in
+common is computed once: daily changes, EMA trend, RSI, forward returns and
+the lower-neighbour positions that decide where local minima are. Per
+parameter set only the support test over the lookback is left, and it is
+shared by all sets that differ only in their RSI or change thresholds.
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+
+import numpy as np
+
+from panel import build_panel, ema, rsi
+from stock_analysis import DEFAULT_PARAMS, StrategyParams
+
+HORIZONS = (5, 10, 20)
+DEFAULT_DAYS = 500
+
+_NONE = -10 ** 9
+
+
+def _lower_neighbours(values):
+    """Positions of the previous and next strictly lower value of each cell, per row.
+
+    Rows without one get a far-away sentinel, so `j - prev` and `next - j`
+    exceed any window.
+    """
+    prev = np.full(values.shape, _NONE, dtype=np.int64)
+    nxt = np.full(values.shape, -_NONE, dtype=np.int64)
+    for i, row in enumerate(values.tolist()):
+        prev_row, next_row = prev[i].tolist(), nxt[i].tolist()
+        stack = []
+        for j, v in enumerate(row):
+            while stack and row[stack[-1]] >= v:
+                stack.pop()
+            if stack:
+                prev_row[j] = stack[-1]
+            stack.append(j)
+        stack = []
+        for j, v in enumerate(row):
+            while stack and row[stack[-1]] > v:
+                next_row[stack.pop()] = j
+            stack.append(j)
+        prev[i], nxt[i] = prev_row, next_row
+    return prev, nxt
+
+
+class SweepData:
+    """Everything a parameter sweep shares, for the last `days` sessions of a panel.
+
+    Matrices are tokens x evaluated sessions; column k is session `start + k`
+    of the panel.
+    """
+
+    def __init__(self, panel, days=DEFAULT_DAYS, horizons=HORIZONS):
+        close, mask = panel.close, panel.mask
+        width = close.shape[1]
+        self.panel = panel
+        self.start = max(width - days, 1)
+        evaluated = slice(self.start, width)
+
+        self.close = close[:, evaluated]
+        self.valid = mask[:, evaluated]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.pct = (self.close / close[:, self.start - 1:width - 1] - 1) * 100
+            self.forward = {}
+            for h in horizons:
+                ahead = np.full(self.close.shape, np.nan)
+                ahead[:, :max(width - self.start - h, 0)] = close[:, self.start + h:]
+                self.forward[h] = ahead / self.close - 1
+
+        self.bars = np.cumsum(mask, axis=1)[:, evaluated]
+        self.trend_ok = ema(close, mask, 50)[:, evaluated] >= ema(close, mask, 200)[:, evaluated]
+        self.rsi = rsi(close, mask)[:, evaluated] if width >= 14 else np.full(self.close.shape, np.nan)
+
+        # Padding never counts as a lower close
+        self.prev_lower, self.next_lower = _lower_neighbours(np.where(mask, close, np.inf))
+        self._support = {}
+
+    def support_ok(self, params):
+        """Where find_support_cluster would find a support cluster (tokens x sessions).
+
+        tolerance_std only decides how supports are grouped, not whether there
+        is one, so it does not matter here.
+        """
+        key = (params.lookback, params.window_pct, params.min_window,
+               params.band_low, params.band_high, params.volume_ratio)
+        if key in self._support:
+            return self._support[key]
+
+        close, volume, mask = self.panel.close, self.panel.volume, self.panel.mask
+        width = close.shape[1]
+        # local_minima's order at each session, from the number of bars seen so far
+        window = np.maximum((self.bars * params.window_pct).astype(np.int64), params.min_window)
+        volume_t = volume[:, self.start:]
+        ok = np.zeros(self.close.shape, dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for d in range(1, params.lookback):
+                skip = max(d - self.start, 0)
+                if skip >= ok.shape[1]:
+                    break
+                j = slice(self.start - d + skip, width - d)
+                positions = np.arange(j.start, j.stop)
+                w = window[:, skip:]
+                # A minimum of its window: no strictly lower close within w bars
+                # before it, nor after it up to the evaluated session
+                minimum = ((positions - self.prev_lower[:, j] > w)
+                           & (self.next_lower[:, j] - positions > np.minimum(w, d)))
+                ratio = self.close[:, skip:] / close[:, j]
+                ok[:, skip:] |= (mask[:, j] & minimum
+                                 & (ratio >= params.band_low) & (ratio <= params.band_high)
+                                 & (volume_t[:, skip:] > volume[:, j] * params.volume_ratio))
+        self._support[key] = ok
+        return ok
+
+    def signals(self, strategy, params):
+        """Boolean tokens x sessions matrix of where `strategy` fires with `params`."""
+        if strategy == "3-5% Gainers":
+            return (self.pct >= params.change_low) & (self.pct <= params.change_high)
+        if strategy == "3-5% Losers":
+            return (self.pct >= -params.change_high) & (self.pct <= -params.change_low)
+        return (self.valid & (self.bars >= params.min_bars) & self.trend_ok
+                & ~(self.rsi > params.rsi_max) & self.support_ok(params))
+
+    def evaluate(self, signals):
+        """Signal count, hit rate and forward returns of a signal matrix."""
+        report = {'signals': int(signals.sum()), 'signal_days': int(signals.any(axis=0).sum())}
+        for h, forward in self.forward.items():
+            returns = forward[signals]
+            returns = returns[~np.isnan(returns)] * 100
+            report[f'hit_rate_{h}d'] = float((returns > 0).mean()) if len(returns) else None
+            report[f'mean_return_{h}d'] = float(returns.mean()) if len(returns) else None
+            report[f'median_return_{h}d'] = float(np.median(returns)) if len(returns) else None
+        return report
+
+
+def param_grid(base=DEFAULT_PARAMS, **values):
+    """Every combination of the given field values, other fields taken from `base`."""
+    names = list(values)
+    return [base._replace(**dict(zip(names, combo))) for combo in itertools.product(*values.values())]
+
+
+def sweep(panel, grid, strategies, days=DEFAULT_DAYS, horizons=HORIZONS):
+    """Evaluate each strategy with every StrategyParams of the grid; returns report rows.
+
+    The first row of each strategy is its baseline: the forward returns of
+    every token on every session, whatever the signal.
+    """
+    data = SweepData(panel, days, horizons)
+    rows = []
+    for strategy in strategies:
+        rows.append(dict(strategy=strategy, params=None, **data.evaluate(data.valid)))
+        for params in grid:
+            rows.append(dict(strategy=strategy, params=params._asdict(),
+                             **data.evaluate(data.signals(strategy, params))))
+    return rows
+
+
+def load_panel(list_name, alice=None):
+    """Panel of the stored daily bars of a stock list, topped up first if `alice` is given."""
+    from bar_store import load_bars
+    from instruments import resolve_stock_list
+
+    instruments = resolve_stock_list(list_name)
+    if alice is not None:
+        from scan_engine import fetch_frames
+        frames = fetch_frames(alice, instruments, 730)
+    else:
+        frames = [(instrument, load_bars(instrument.token)) for instrument in instruments]
+    return build_panel([(instrument, df) for instrument, df in frames if not df.empty])
+
+
+def _field_type(name):
+    return type(getattr(DEFAULT_PARAMS, name))
+
+
+def main():
+    from stock_lists import STOCK_LISTS
+    from scan_engine import STRATEGIES
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--list', default="NIFTY 500", choices=list(STOCK_LISTS))
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="sessions to evaluate")
+    parser.add_argument('--horizons', type=int, nargs='+', default=list(HORIZONS),
+                        help="forward return horizons in sessions")
+    for name in StrategyParams._fields:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, nargs='+', type=_field_type(name),
+                            help=f"values to sweep (default {getattr(DEFAULT_PARAMS, name)})")
+    parser.add_argument('--fetch', action='store_true', help="top up the bar store from the broker first")
+    parser.add_argument('--output', help="write the report as JSON here")
+    args = parser.parse_args()
+
+    alice = None
+    if args.fetch:
+        from batch_screener import connect
+        alice = connect()
+
+    start = time.perf_counter()
+    panel = load_panel(args.list, alice)
+    if not len(panel):
+        print(f"No stored bars for {args.list}; run the screener or pass --fetch first.")
+        return 1
+    loaded = time.perf_counter() - start
+
+    grid = param_grid(**{name: getattr(args, name) for name in StrategyParams._fields
+                         if getattr(args, name)})
+    start = time.perf_counter()
+    rows = sweep(panel, grid, args.strategies, args.days, tuple(args.horizons))
+    elapsed = time.perf_counter() - start
+
+    h = args.horizons[0]
+    print(f"{len(panel)} tokens, {min(args.days, panel.close.shape[1] - 1)} sessions, "
+          f"{len(grid)} parameter sets (load {loaded:.1f}s, sweep {elapsed:.1f}s)")
+    for row in rows:
+        hit_rate, mean = row[f'hit_rate_{h}d'], row[f'mean_return_{h}d']
+        label = "baseline" if row['params'] is None else ", ".join(
+            f"{k}={v}" for k, v in row['params'].items() if getattr(DEFAULT_PARAMS, k) != v) or "defaults"
+        print(f"{row['strategy']:<24} {label:<48} {row['signals']:>8} signals  "
+              f"hit {h}d {'-' if hit_rate is None else f'{hit_rate:.1%}':>6}  "
+              f"mean {h}d {'-' if mean is None else f'{mean:+.2f}%':>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'list': args.list, 'tokens': len(panel), 'days': args.days,
+                       'horizons': args.horizons, 'rows': rows}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
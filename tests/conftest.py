@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep bars, caches and state of the tests out of the working tree; set before
+# the modules read these at import time
+SCRATCH = tempfile.mkdtemp(prefix="screener-tests-")
+os.environ["BAR_STORE_DIR"] = os.path.join(SCRATCH, "bars")
+os.environ["INDICATOR_STATE_FILE"] = os.path.join(SCRATCH, "indicator_state.npz")
+os.environ["RESULT_CACHE_FILE"] = os.path.join(SCRATCH, "results.sqlite")
+os.environ["SNAPSHOT_DIR"] = os.path.join(SCRATCH, "snapshots")
+os.environ["SHARD_QUEUE_FILE"] = os.path.join(SCRATCH, "shards.sqlite")
+os.chdir(SCRATCH)
@@ -0,0 +1,40 @@
+import asyncio
+
+import bar_store
+from async_client import AsyncBroker, TokenBucket, get_bars_async
+from fake_broker import FakeAlice, FakeBrokerServer
+from instruments import Instrument
+
+
+def test_throttled_requests_are_retried_on_pooled_connections(monkeypatch, tmp_path):
+    monkeypatch.setattr(bar_store, 'STORE_DIR', str(tmp_path))
+    server = FakeBrokerServer(throttle_rate=0.3, rate_limit=100).start()
+    bucket = TokenBucket(rate=200, capacity=20)
+    broker = AsyncBroker(FakeAlice(server.base_url), bucket=bucket, max_concurrency=10,
+                         max_retries=10, backoff=0.01)
+    instruments = [Instrument('NSE', token, f'SYM{token}', f'SYM{token}-EQ', '', 1, 0.05, '')
+                   for token in range(1, 101)]
+
+    async def fetch_all():
+        return await asyncio.gather(*(get_bars_async(broker, instrument, 30) for instrument in instruments))
+
+    drained = []
+    drain = bucket.drain
+
+    def counting_drain():
+        drained.append(True)
+        drain()
+
+    monkeypatch.setattr(bucket, 'drain', counting_drain)
+    try:
+        frames = asyncio.run(fetch_all())
+    finally:
+        broker.close()
+        server.stop()
+
+    assert all(not df.empty for df in frames)
+    assert server.stats['throttled'] > 0
+    assert broker.stats['throttled'] == server.stats['throttled'] == len(drained)
+    assert broker.stats['requests'] == server.stats['requests'] == 100 + server.stats['throttled']
+    # Kept-alive connections, at most one per concurrent request
+    assert server.stats['connections'] <= 10
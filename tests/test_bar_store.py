@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import bar_store
+from instruments import Instrument
+
+
+class RecentListing:
+    """Broker stub for a token listed 30 days ago; counts history requests."""
+
+    def __init__(self, failures=0):
+        self.calls = 0
+        self.failures = failures
+        self.listed = pd.Timestamp(datetime.now().date() - timedelta(days=30))
+
+    def get_historical(self, instrument, from_datetime, to_datetime, interval):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            return {'stat': 'Not_Ok', 'emsg': 'Internal server error'}
+        days = pd.bdate_range(max(pd.Timestamp(from_datetime).normalize(), self.listed), to_datetime)
+        if days.empty:
+            return {'stat': 'Not_Ok', 'emsg': 'No data'}
+        return pd.DataFrame({'datetime': days, 'open': 10.0, 'high': 11.0, 'low': 9.0,
+                             'close': 10.0, 'volume': 1000.0})
+
+
+def test_missing_head_of_a_recent_listing_is_asked_for_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(bar_store, 'STORE_DIR', str(tmp_path))
+    broker = RecentListing()
+    instrument = Instrument('NSE', 99001, 'NEW', 'NEW-EQ', '', 1, 0.05, '')
+
+    for _ in range(3):
+        df = bar_store.get_bars(broker, instrument, 730)
+    assert broker.calls == 1
+    assert df['datetime'].iloc[0] == broker.listed
+
+    # Asking further back than ever before goes to the broker again
+    bar_store.get_bars(broker, instrument, 1000)
+    assert broker.calls == 2
+
+
+def test_failed_head_request_is_asked_for_again(monkeypatch, tmp_path):
+    monkeypatch.setattr(bar_store, 'STORE_DIR', str(tmp_path))
+    broker = RecentListing()
+    instrument = Instrument('NSE', 99002, 'NEW', 'NEW-EQ', '', 1, 0.05, '')
+    bar_store.get_bars(broker, instrument, 5)
+
+    # The head request fails; the next call must ask for it again
+    broker.failures = 1
+    bar_store.expire_topups([instrument.token])
+    assert len(bar_store.get_bars(broker, instrument, 730)) < 5
+    df = bar_store.get_bars(broker, instrument, 730)
+    assert df['datetime'].iloc[0] == broker.listed
+    assert len(bar_store.get_bars(broker, instrument, 730)) == len(df)
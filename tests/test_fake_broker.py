@@ -0,0 +1,9 @@
+from datetime import datetime
+
+from fake_broker import random_walk_bars
+
+
+def test_overlapping_requests_agree_on_every_bar():
+    short = random_walk_bars(4, datetime(2026, 9, 1), datetime(2026, 10, 10))
+    long = random_walk_bars(4, datetime(2026, 9, 1), datetime(2026, 10, 16))
+    assert long[:len(short)] == short
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import scan_engine
+from bar_store import load_bars
+from fake_broker import FakeAlice, FakeBrokerServer
+from indicator_state import IndicatorStates, load_states
+from instruments import Instrument, resolve_stock_list
+from panel import build_panel
+from stock_analysis import compute_rsi
+
+EMA = "EMA, RSI & Support Zone"
+
+
+@pytest.fixture
+def alice():
+    server = FakeBrokerServer().start()
+    yield FakeAlice(server.base_url)
+    server.stop()
+
+
+def test_gainers_scan_does_not_seed_ema_state(alice):
+    instruments = resolve_stock_list("NIFTY 50")
+    scan_engine.scan_tokens(alice, instruments, ["3-5% Gainers"], processes=0)
+    scan_engine.clear_session_frames()
+
+    panel_rows = scan_engine.scan_tokens(alice, instruments, [EMA], processes=0)[EMA]
+    frame_rows = scan_engine.scan_tokens(alice, instruments, [EMA], use_panel=False)[EMA]
+    assert sorted(row['Token'] for row in panel_rows) == sorted(row['Token'] for row in frame_rows)
+
+    assert len(panel_rows) > 0
+    since = pd.Timestamp.now() - pd.Timedelta(days=scan_engine.STATE_DAYS)
+    assert load_states().verify(load_bars, since, [i.token for i in instruments]) == []
+
+
+def _bars(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'datetime': pd.bdate_range("2024-01-01", periods=n),
+        'close': 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n))),
+        'volume': rng.integers(1_000, 50_000, n).astype(float),
+    })
+
+
+def test_state_follows_a_sliding_window():
+    instrument = Instrument('NSE', 1, 'SYM1', 'SYM1-EQ', '', 1, 0.05, '')
+    bars = _bars(400)
+    states = IndicatorStates()
+    states.advance(build_panel([(instrument, bars.iloc[:300])]), today=bars['datetime'].iloc[-1])
+
+    # Ten sessions later the window has moved on by ten bars at both ends
+    window = bars.iloc[10:310]
+    states.advance(build_panel([(instrument, window)]), today=bars['datetime'].iloc[-1])
+
+    indicators = states.indicators(build_panel([(instrument, window)]))
+    closes = window['close'].reset_index(drop=True)
+    assert indicators['ema_50'][0] == pytest.approx(closes.ewm(span=50).mean().iloc[-1], rel=1e-9)
+    assert indicators['ema_200'][0] == pytest.approx(closes.ewm(span=200).mean().iloc[-1], rel=1e-9)
+    assert indicators['rsi'][0] == pytest.approx(compute_rsi(closes), rel=1e-9)
+    assert states.verify(lambda token: bars, window['datetime'].iloc[0]) == []
@@ -0,0 +1,25 @@
+import scan_engine
+from bar_store import expire_topups
+from fake_broker import FakeAlice, FakeBrokerServer
+from instruments import resolve_stock_list
+from live_feed import LiveFeed
+
+
+def test_tokens_whose_history_failed_are_watched_again():
+    server = FakeBrokerServer().start()
+    server.expired_sessions.add('fake-session')
+    try:
+        instruments = resolve_stock_list("NIFTY 50")[:5]
+        tokens = [instrument.token for instrument in instruments]
+        scan_engine.clear_session_frames(tokens)
+        expire_topups(tokens)
+
+        feed = LiveFeed(FakeAlice(server.base_url))
+        feed.watch(instruments)
+        assert len(feed.screener) == 0
+
+        server.expired_sessions.clear()
+        feed.watch(instruments)
+        assert sorted(int(i.token) for i in feed.screener.instruments) == sorted(tokens)
+    finally:
+        server.stop()
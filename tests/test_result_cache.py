@@ -0,0 +1,26 @@
+import pytest
+
+from result_cache import ResultCache
+
+
+def test_interrupted_scan_releases_its_leases(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    first = ResultCache("3-5% Gainers", path=path)
+    second = ResultCache("3-5% Gainers", path=path)
+
+    claimed = first.claim([1, 2, 3])
+    with pytest.raises(KeyboardInterrupt):
+        with first.leasing(claimed):
+            first.store({1: None})
+            raise KeyboardInterrupt
+
+    assert second.leased([1, 2, 3]) == set()
+    assert second.claim([2, 3]) == [2, 3]
+    assert second.lookup([1, 2, 3]) == ({1: None}, [2, 3])
+
+
+def test_evicted_tokens_are_computed_again(tmp_path):
+    cache = ResultCache("3-5% Gainers", path=str(tmp_path / "results.sqlite"))
+    cache.store({1: None, 2: {'Token': 2}})
+    cache.evict([2])
+    assert cache.lookup([1, 2]) == ({1: None}, [2])
@@ -0,0 +1,63 @@
+import datetime
+import threading
+
+import pandas as pd
+
+import scan_engine
+from bar_store import expire_topups
+from fake_broker import FakeAlice, FakeBrokerServer
+from indicator_state import load_states
+from instruments import resolve_stock_list
+
+
+def test_session_frames_expire_at_the_close(monkeypatch):
+    df = pd.DataFrame({'datetime': [pd.Timestamp("2026-10-15")], 'close': [100.0]})
+    monkeypatch.setattr(scan_engine, 'last_completed_session', lambda: datetime.date(2026, 10, 14))
+    scan_engine._cache_frame(1, 5, df)
+    assert scan_engine.has_session_frame(1, 5)
+
+    # The 15 Oct session closed: frames fetched before it are stale
+    monkeypatch.setattr(scan_engine, 'last_completed_session', lambda: datetime.date(2026, 10, 15))
+    assert not scan_engine.has_session_frame(1, 5)
+    scan_engine.clear_session_frames()
+
+
+def test_rejected_session_is_marked_expired():
+    server = FakeBrokerServer().start()
+    server.expired_sessions.add('stale')
+    try:
+        alice = FakeAlice(server.base_url, session_id='stale')
+        instruments = resolve_stock_list("NIFTY 50")[:5]
+        # Make the scan ask the broker even if an earlier test fetched these tokens
+        scan_engine.clear_session_frames([instrument.token for instrument in instruments])
+        expire_topups([instrument.token for instrument in instruments])
+        rows, failed = scan_engine.scan_rows(alice, instruments, "3-5% Gainers", processes=0)
+        assert failed == [instrument.token for instrument in instruments]
+        assert alice.session_expired
+    finally:
+        server.stop()
+
+
+def test_ema_scans_do_not_hold_the_state_lock_while_fetching(monkeypatch):
+    server = FakeBrokerServer().start()
+    alice = FakeAlice(server.base_url)
+    instruments = resolve_stock_list("NIFTY 50")
+    first, second = instruments[:25], instruments[25:]
+    ema = ["EMA, RSI & Support Zone"]
+
+    def pipeline_with_another_scan(alice, instruments, strategies, days, states, processes, max_workers):
+        # Another session's scan runs while this one is fetching
+        other = threading.Thread(target=scan_engine.scan_tokens, args=(alice, second, ema), kwargs={'processes': 0})
+        other.start()
+        other.join(timeout=60)
+        assert not other.is_alive()
+        return scan_engine.screen_frames(scan_engine.fetch_frames(alice, instruments, days), strategies, states)
+
+    monkeypatch.setattr(scan_engine, 'run_pipeline', pipeline_with_another_scan)
+    try:
+        scan_engine.scan_tokens(alice, first, ema, processes=2)
+    finally:
+        server.stop()
+
+    states = load_states()
+    assert all(states.bars[states.rows([i.token for i in instruments])] > 0)
@@ -0,0 +1,33 @@
+import pytest
+
+import scan_engine
+from fake_broker import FakeAlice, FakeBrokerServer
+from instruments import resolve_stock_list
+from sharded_scan import QueueServer, ShardQueue, run_worker
+
+STRATEGIES = ["3-5% Gainers", "3-5% Losers"]
+
+
+@pytest.fixture
+def alice():
+    server = FakeBrokerServer().start()
+    yield FakeAlice(server.base_url)
+    server.stop()
+
+
+def test_remote_worker_scans_through_the_queue_server(alice, tmp_path):
+    instruments = resolve_stock_list("NIFTY 50")
+    queue = ShardQueue(str(tmp_path / "shards.sqlite"))
+    job = queue.submit(instruments, STRATEGIES, shard_size=20)
+    server = QueueServer(queue, "127.0.0.1").start()
+    try:
+        assert run_worker(alice, server.url, job, processes=0, owner="remote") == len(instruments)
+    finally:
+        server.stop()
+
+    assert set(queue.status(job)) == {'done'}
+    expected = scan_engine.scan_tokens(alice, instruments, STRATEGIES, processes=0)
+    outcomes = queue.results(job)
+    for strategy in STRATEGIES:
+        rows = [row for row in outcomes[strategy].values() if row is not None]
+        assert sorted(row['Token'] for row in rows) == sorted(row['Token'] for row in expected[strategy])